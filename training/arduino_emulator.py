@@ -0,0 +1,345 @@
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+import iq_quantization
+import spectrum_painting_data as sp_data
+import spectrum_painting_training as sp_training
+from spectrogram import create_spectrogram_values
+
+# Emulate the spectrum painting pipeline in arduino/spectrum_painting/spectrum_painting.ino
+# with NumPy so the images the Arduino gives the model can be created for whole datasets.
+#
+# Every step does the same float32 operations in the same order as the firmware, e.g sums
+# are accumulated one value at a time and the FFT uses kiss_fft's radix-4 and radix-2
+# butterflies with its twiddle factors. This assumes the compiler does not fuse multiplies
+# and adds into FMA instructions. Every function works on a single spectrogram or a batch
+# of them in the leading axes.
+
+NUM_WINDOWS = 256
+SAMPLES = 256
+NFFT = 64
+TARGET_RESOLUTION = 64
+
+
+def quantize_iq(iq: npt.NDArray[np.complex128],
+                options: Optional[iq_quantization.QuantizationOptions] = None
+                ) -> Tuple[npt.NDArray[np.int8], npt.NDArray[np.int8]]:
+    """
+    Scale decimated I/Q samples to int8 in the same way as save_iq_data does for data.h.
+
+    :param iq: The samples of one spectrogram, or a (..., samples) array with one row per spectrogram.
+               Each row is scaled separately.
+    :param options: The same quantization options as the data.h files. Defaults to the real_max scaling.
+    :return: The real and imaginary parts.
+    """
+    quantized = iq_quantization.quantize_iq(iq, options)
+
+    return quantized.real, quantized.imag
+
+
+def get_twiddles(nfft: int) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.float32]]:
+    """
+    The twiddle factors of kiss_fft_alloc. They are computed in double precision and rounded to float.
+    """
+    phase = -2 * np.pi * np.arange(nfft) / nfft
+
+    return np.cos(phase).astype(np.float32), np.sin(phase).astype(np.float32)
+
+
+def get_factors(nfft: int) -> List[Tuple[int, int]]:
+    """
+    The (radix, remaining length) of each stage like kf_factor. Only powers of two are supported.
+    """
+    if nfft < 2 or nfft & (nfft - 1) != 0:
+        raise ValueError("The emulated FFT length must be a power of two")
+
+    factors = []
+    n = nfft
+
+    while n > 1:
+        p = 4 if n % 4 == 0 else 2
+        n //= p
+        factors.append((p, n))
+
+    return factors
+
+
+def _multiply(ar, ai, br, bi):
+    # C_MUL
+    return ar * br - ai * bi, ar * bi + ai * br
+
+
+def _butterfly_2(fr, fi, fstride: int, m: int, twiddles):
+    (tr, ti) = (t[:m * fstride:fstride] for t in twiddles)
+
+    (f0r, f0i) = (fr[..., :m], fi[..., :m])
+    (f1r, f1i) = (fr[..., m:], fi[..., m:])
+
+    (sr, si) = _multiply(f1r, f1i, tr, ti)
+
+    return np.concatenate((f0r + sr, f0r - sr), axis=-1), np.concatenate((f0i + si, f0i - si), axis=-1)
+
+
+def _butterfly_4(fr, fi, fstride: int, m: int, twiddles):
+    k = np.arange(m)
+    (tw1r, tw1i) = (t[k * fstride] for t in twiddles)
+    (tw2r, tw2i) = (t[k * fstride * 2] for t in twiddles)
+    (tw3r, tw3i) = (t[k * fstride * 3] for t in twiddles)
+
+    (f0r, f0i) = (fr[..., :m], fi[..., :m])
+    (f1r, f1i) = (fr[..., m:2 * m], fi[..., m:2 * m])
+    (f2r, f2i) = (fr[..., 2 * m:3 * m], fi[..., 2 * m:3 * m])
+    (f3r, f3i) = (fr[..., 3 * m:], fi[..., 3 * m:])
+
+    (s0r, s0i) = _multiply(f1r, f1i, tw1r, tw1i)
+    (s1r, s1i) = _multiply(f2r, f2i, tw2r, tw2i)
+    (s2r, s2i) = _multiply(f3r, f3i, tw3r, tw3i)
+
+    (s5r, s5i) = (f0r - s1r, f0i - s1i)
+    (f0r, f0i) = (f0r + s1r, f0i + s1i)
+    (s3r, s3i) = (s0r + s2r, s0i + s2i)
+    (s4r, s4i) = (s0r - s2r, s0i - s2i)
+
+    (out2r, out2i) = (f0r - s3r, f0i - s3i)
+    (out0r, out0i) = (f0r + s3r, f0i + s3i)
+    (out1r, out1i) = (s5r + s4i, s5i - s4r)
+    (out3r, out3i) = (s5r - s4i, s5i + s4r)
+
+    return (np.concatenate((out0r, out1r, out2r, out3r), axis=-1),
+            np.concatenate((out0i, out1i, out2i, out3i), axis=-1))
+
+
+def _work(real, imag, offset: int, fstride: int, factors: List[Tuple[int, int]], twiddles):
+    # kf_work for every FFT in the batch at once.
+    (p, m) = factors[0]
+
+    if m == 1:
+        indices = offset + fstride * np.arange(p)
+        (fr, fi) = (real[..., indices], imag[..., indices])
+    else:
+        parts = [_work(real, imag, offset + q * fstride, fstride * p, factors[1:], twiddles) for q in range(p)]
+        fr = np.concatenate([r for (r, _) in parts], axis=-1)
+        fi = np.concatenate([i for (_, i) in parts], axis=-1)
+
+    if p == 4:
+        return _butterfly_4(fr, fi, fstride, m, twiddles)
+
+    return _butterfly_2(fr, fi, fstride, m, twiddles)
+
+
+def kiss_fft(real: npt.NDArray, imag: npt.NDArray, nfft: int) -> Tuple[npt.NDArray[np.float32], npt.NDArray[np.float32]]:
+    """
+    The forward float32 kiss_fft of the first nfft values of the last axis.
+    Like the firmware, the FFT only reads the first nfft samples of a longer window.
+
+    :return: The real and imaginary parts of the FFT.
+    """
+    real = np.asarray(real)[..., :nfft].astype(np.float32)
+    imag = np.asarray(imag)[..., :nfft].astype(np.float32)
+
+    return _work(real, imag, 0, 1, get_factors(nfft), get_twiddles(nfft))
+
+
+def _sum(x: npt.NDArray[np.float32], axis: int = -1) -> npt.NDArray[np.float32]:
+    # Add the values one at a time like a C loop rather than with pairwise summation.
+    return np.take(np.add.accumulate(x, axis=axis, dtype=np.float32), -1, axis=axis)
+
+
+def create_downsampled_spectrogram(real: npt.NDArray[np.int8],
+                                   imag: npt.NDArray[np.int8],
+                                   windows: int = NUM_WINDOWS,
+                                   window_length: int = SAMPLES,
+                                   nfft: int = NFFT,
+                                   resolution: int = TARGET_RESOLUTION) -> npt.NDArray[np.float32]:
+    """
+    createDownsampledSpectrogram: the FFT magnitude of each window, downsampled to
+    (resolution, resolution) with the two halves of the frequencies swapped.
+
+    :param real: The real part of windows * window_length samples, or a (..., samples) batch.
+    :param imag: The imaginary part.
+    """
+    batch_shape = np.shape(real)[:-1]
+    shape = batch_shape + (windows, window_length)
+
+    (fft_real, fft_imag) = kiss_fft(np.reshape(real, shape), np.reshape(imag, shape), nfft)
+    magnitudes = np.sqrt(fft_real * fft_real + fft_imag * fft_imag)
+
+    time_factor = windows // resolution
+    freq_factor = nfft // resolution
+
+    # The mean of each group of freq_factor frequency bins.
+    freq_groups = magnitudes[..., :resolution * freq_factor].reshape(batch_shape + (windows, resolution, freq_factor))
+    freq_means = _sum(freq_groups) / np.float32(freq_factor)
+
+    middle = resolution // 2
+    freq_means = np.concatenate((freq_means[..., middle:], freq_means[..., :middle]), axis=-1)
+
+    # The mean of each group of time_factor rows.
+    time_groups = freq_means[..., :resolution * time_factor, :].reshape(
+        batch_shape + (resolution, time_factor, resolution))
+    downsampled = _sum(time_groups, axis=-2) / np.float32(time_factor)
+
+    if time_factor == 1:
+        # The firmware does not write the first row when every row is its own group,
+        # so the rows move up by one and the last row stays zero.
+        downsampled = np.concatenate((downsampled[..., 1:, :], np.zeros_like(downsampled[..., :1, :])), axis=-2)
+
+    return downsampled
+
+
+def augment(downsampled: npt.NDArray[np.float32], k: int = 3, l: int = 16, d: int = 4) -> Tuple[
+        npt.NDArray[np.float32], npt.NDArray[np.float32]]:
+    """
+    augment: the mean of the top k values in each window of length l with a step of d,
+    minus the mean of the spectrogram and clipped at 0.
+
+    :return: The augmented spectrogram and the downsampled spectrogram after augment modified
+             it. The firmware writes the mean of the top k values into the start of each window
+             of the downsampled spectrogram and paint uses the modified values.
+    """
+    downsampled = np.array(downsampled, dtype=np.float32)
+    (time_bins, freq_bins) = downsampled.shape[-2:]
+    batch_shape = downsampled.shape[:-2]
+
+    input_mean = _sum(downsampled.reshape(batch_shape + (-1,))) / np.float32(time_bins * freq_bins)
+
+    window_starts = np.arange(0, freq_bins - l + 1, d)
+    windows = np.sort(downsampled[..., window_starts[:, np.newaxis] + np.arange(l)], axis=-1)
+
+    mean_top_k = np.zeros(windows.shape[:-1], dtype=np.float32)
+
+    for i in range(k):
+        mean_top_k += windows[..., (l - 1) - i]
+
+    mean_top_k /= np.float32(k)
+
+    downsampled[..., window_starts] = mean_top_k
+    augmented = np.maximum(mean_top_k - input_mean[..., np.newaxis, np.newaxis], np.float32(0))
+
+    return augmented, downsampled
+
+
+def paint(downsampled: npt.NDArray[np.float32], augmented: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    """
+    paint: the augmented spectrogram minus the mean of each row of the downsampled spectrogram, clipped at 0.
+
+    :param downsampled: The downsampled spectrogram after augment modified it.
+    """
+    freq_bins = downsampled.shape[-1]
+    mean_time_original = _sum(downsampled) / np.float32(freq_bins)
+
+    return np.maximum(augmented - mean_time_original[..., np.newaxis], np.float32(0))
+
+
+def digitize(x: npt.NDArray[np.float32]) -> npt.NDArray[np.uint8]:
+    """
+    digitize: scale the values so the maximum is 255 and truncate them to uint8.
+    """
+    max_value = np.max(x, axis=(-2, -1), keepdims=True)
+
+    # If the maximum is 0 then every value is 0 and there is nothing to scale.
+    scale = np.float32(255) / np.where(max_value == 0, np.float32(1), max_value)
+
+    return (x * scale).astype(np.uint8)
+
+
+def create_augmented_painted_images(real: npt.NDArray[np.int8],
+                                    imag: npt.NDArray[np.int8],
+                                    options: sp_training.SpectrumPaintingTrainingOptions,
+                                    windows: int = NUM_WINDOWS,
+                                    window_length: int = SAMPLES,
+                                    nfft: int = NFFT) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.uint8]]:
+    """
+    Create the digitized augmented and painted images that the Arduino gives to the model.
+
+    :return: The augmented and painted images with shape (..., resolution, augmented width).
+    """
+    downsampled = create_downsampled_spectrogram(real, imag, windows, window_length, nfft,
+                                                 options.downsample_resolution)
+    (augmented, downsampled) = augment(downsampled, options.k, options.l, options.d)
+    painted = paint(downsampled, augmented)
+
+    return digitize(augmented), digitize(painted)
+
+
+def evaluate_accuracy_gap(lite_model: bytes,
+                          data_dir: str,
+                          classes: List[str],
+                          snr_list: List[int],
+                          options: sp_training.SpectrumPaintingTrainingOptions,
+                          spectrogram_count: int = -1,
+                          windows: int = NUM_WINDOWS,
+                          window_length: int = SAMPLES,
+                          nfft: int = NFFT,
+                          chunk_size: int = 256,
+                          quantization: Optional[iq_quantization.QuantizationOptions] = None
+                          ) -> Dict[int, Tuple[float, float]]:
+    """
+    Classify every spectrogram in the data files with the images from the PC pipeline and
+    the emulated Arduino pipeline.
+
+    :param lite_model: The contents of the quantized .tflite file.
+    :param chunk_size: The number of spectrograms to process at once.
+    :param quantization: The quantization of the samples on the Arduino.
+    :return: Maps each SNR to the accuracy of the PC pipeline and the Arduino pipeline.
+    """
+    import spectrum_painting_predict as sp_predict
+
+    runner = sp_predict.LiteModelRunner(lite_model)
+    samples_per_spectrogram = windows * window_length
+
+    files = sp_data.get_spectrogram_files(data_dir, classes, snr_list, samples_per_spectrogram, spectrogram_count)
+    accuracies: Dict[int, Tuple[float, float]] = {}
+
+    for snr in snr_list:
+        pc_correct = 0
+        arduino_correct = 0
+        total = 0
+
+        for spectrogram_file in [f for f in files if f.snr == snr]:
+            data = sp_data.load_decimated_iq_data(spectrogram_file.file)
+            label = classes.index(spectrogram_file.label)
+
+            for start in range(0, spectrogram_file.count, chunk_size):
+                chunk_count = min(chunk_size, spectrogram_file.count - start)
+                # Keep the complex128 samples of the data files. data.h is quantized from them in float64.
+                iq = np.asarray(data[start * samples_per_spectrogram:(start + chunk_count) * samples_per_spectrogram])
+                iq = iq.reshape((chunk_count, samples_per_spectrogram))
+
+                spectrograms = create_spectrogram_values(iq, windows, window_length, nfft, dtype=np.float64)
+                (pc_augmented, pc_painted) = sp_training.create_augmented_painted_images_batch(spectrograms, options)
+
+                (real, imag) = quantize_iq(iq, quantization)
+                (arduino_augmented, arduino_painted) = create_augmented_painted_images(real, imag, options, windows,
+                                                                                       window_length, nfft)
+
+                pc_correct += np.sum(runner.predict_batch(pc_augmented, pc_painted) == label)
+                arduino_correct += np.sum(runner.predict_batch(arduino_augmented, arduino_painted) == label)
+                total += chunk_count
+
+        accuracies[snr] = (pc_correct / total, arduino_correct / total)
+
+    return accuracies
+
+
+if __name__ == "__main__":
+    # python arduino_emulator.py <model.tflite> [spectrograms per file]
+    with open(sys.argv[1], "rb") as f:
+        model_content = f.read()
+
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else -1
+
+    results = evaluate_accuracy_gap(model_content,
+                                    data_dir="data/numpy",
+                                    classes=["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"],
+                                    snr_list=[0, 5, 10, 15, 20, 25, 30],
+                                    options=sp_training.SpectrumPaintingTrainingOptions(
+                                        downsample_resolution=TARGET_RESOLUTION, k=3, l=16, d=4),
+                                    spectrogram_count=count)
+
+    for (snr, (pc_accuracy, arduino_accuracy)) in results.items():
+        print(f"SNR {snr}: PC = {pc_accuracy:.3f}, Arduino = {arduino_accuracy:.3f}, "
+              f"gap = {pc_accuracy - arduino_accuracy:.3f}")
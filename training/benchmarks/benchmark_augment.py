@@ -0,0 +1,41 @@
+import timeit
+
+import numpy as np
+
+import spectrum_painting as sp
+
+# Compare the vectorized augment_spectrogram with the loop that follows the Arduino
+# for a 64x64 downsampled spectrogram. Run from the training folder with
+# python -m benchmarks.benchmark_augment
+
+k = 3
+l = 16
+d = 4
+batch_size = 256
+repeats = 5
+
+rng = np.random.default_rng(seed=0)
+spectrograms = rng.random((batch_size, 64, 64))
+
+
+def loop():
+    for s in spectrograms:
+        sp.augment_spectrogram_loop(s, k, l, d)
+
+
+def vectorized():
+    for s in spectrograms:
+        sp.augment_spectrogram(s, k, l, d)
+
+
+def batched():
+    sp.augment_spectrogram(spectrograms, k, l, d)
+
+
+loop_time = min(timeit.repeat(loop, number=1, repeat=repeats)) / batch_size
+vectorized_time = min(timeit.repeat(vectorized, number=1, repeat=repeats)) / batch_size
+batched_time = min(timeit.repeat(batched, number=1, repeat=repeats)) / batch_size
+
+print(f"Loop = {loop_time * 1e6:.1f} us per spectrogram")
+print(f"Vectorized = {vectorized_time * 1e6:.1f} us per spectrogram ({loop_time / vectorized_time:.1f}x)")
+print(f"Vectorized batch of {batch_size} = {batched_time * 1e6:.1f} us per spectrogram ({loop_time / batched_time:.1f}x)")
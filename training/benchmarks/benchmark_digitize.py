@@ -0,0 +1,57 @@
+import sys
+import timeit
+
+import numpy as np
+
+import spectrum_painting as sp
+
+# Check that digitizing a batch of spectrograms gives the same images as digitizing each
+# spectrogram with digitize_spectrogram_single, and compare their times. The batches are
+# float32, float64 and integer spectrograms, with an all zero spectrogram in each batch.
+# Run from the training folder with
+# python -m benchmarks.benchmark_digitize
+# The exit code is 1 if any image is different.
+
+batch_size = 256
+repeats = 5
+
+rng = np.random.default_rng(seed=0)
+
+values = rng.random((batch_size, 64, 13)) * rng.uniform(0.001, 1000, size=(batch_size, 1, 1))
+batches = {
+    "float32": values.astype(np.float32),
+    "float64": values,
+    "uint8": rng.integers(0, 256, size=values.shape, dtype=np.uint8),
+    "int16": rng.integers(-1000, 1000, size=values.shape, dtype=np.int16),
+    "int64": rng.integers(0, 2 ** 40, size=values.shape, dtype=np.int64),
+}
+
+different_batches = []
+
+print(f"{'Data type':>10} {'Different':>10} {'Single (us)':>12} {'Batch (us)':>11} {'Speedup':>8}")
+
+for (name, spectrograms) in batches.items():
+    spectrograms[0] = 0
+
+    expected = np.stack([sp.digitize_spectrogram_single(s) for s in spectrograms])
+    different = np.count_nonzero(sp.digitize_spectrogram(spectrograms) != expected)
+
+    if different > 0:
+        different_batches.append(name)
+
+    def single(s=spectrograms):
+        for spectrogram in s:
+            sp.digitize_spectrogram_single(spectrogram)
+
+    def batched(s=spectrograms):
+        sp.digitize_spectrogram(s)
+
+    single_time = min(timeit.repeat(single, number=1, repeat=repeats)) / batch_size
+    batched_time = min(timeit.repeat(batched, number=1, repeat=repeats)) / batch_size
+
+    print(f"{name:>10} {different:>10} {single_time * 1e6:>12.1f} {batched_time * 1e6:>11.1f} "
+          f"{single_time / batched_time:>7.1f}x")
+
+if len(different_batches) > 0:
+    print(f"digitize_spectrogram is different to digitize_spectrogram_single for {different_batches}")
+    sys.exit(1)
@@ -0,0 +1,41 @@
+import sys
+import tracemalloc
+
+import spectrum_painting_data as sp_data
+
+# Measure the peak memory allocated while loading every class and SNR with and
+# without memory-mapping the data files. NumPy reports its allocations to
+# tracemalloc, while pages of a memory-mapped file are backed by the file and
+# can be dropped by the OS at any time so they are not counted.
+# Run from the training folder with python -m benchmarks.benchmark_load_memory [data_dir]
+
+classes = ["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"]
+snr_list = [0, 5, 10, 15, 20, 25, 30]
+
+
+def peak_memory(data_dir: str, mmap: bool) -> int:
+    tracemalloc.start()
+
+    spectrograms = sp_data.load_spectrograms(data_dir=data_dir,
+                                             classes=classes,
+                                             snr_list=snr_list,
+                                             windows_per_spectrogram=256,
+                                             window_length=256,
+                                             nfft=64,
+                                             mmap=mmap)
+
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del spectrograms
+
+    return peak
+
+
+data_dir = sys.argv[1] if len(sys.argv) > 1 else "data/numpy"
+
+peak_load = peak_memory(data_dir, mmap=False)
+peak_mmap = peak_memory(data_dir, mmap=True)
+
+print(f"Peak memory (np.load) = {peak_load / 1e6:.1f} MB")
+print(f"Peak memory (mmap) = {peak_mmap / 1e6:.1f} MB")
+print(f"Reduction = {(1 - peak_mmap / peak_load) * 100:.1f}%")
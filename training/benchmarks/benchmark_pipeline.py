@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import spectrum_painting as sp
+import spectrum_painting_training as sp_training
+from spectrogram import create_spectrogram
+
+# Time every stage of the Python pipeline, like the stage timings the Arduino prints over serial,
+# and compare them with a stored baseline. The samples and models are random so no data is needed,
+# and the models are not trained because the time of a prediction does not depend on the weights.
+#
+# Run from the training folder with
+# python -m benchmarks.benchmark_pipeline --output output/benchmark-pipeline.json
+# and save a run as the baseline on the machine the benchmarks are compared on, e.g
+# python -m benchmarks.benchmark_pipeline --output benchmarks/baseline.json
+# python -m benchmarks.benchmark_pipeline --baseline benchmarks/baseline.json
+# The exit code is 1 if any benchmark is slower than the baseline by more than the tolerance.
+
+RESULTS_VERSION = 1
+
+number_samples = 65536
+nfft = 64
+batch_size = 64
+calibration_images = 16
+
+options = sp_training.SpectrumPaintingTrainingOptions(downsample_resolution=64, k=3, l=16, d=4)
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    The times of one call in seconds.
+
+    number: The number of calls in each repeat.
+    """
+    min: float
+    median: float
+    mean: float
+    number: int
+    repeats: int
+
+
+Benchmark = Tuple[str, Callable[[], object]]
+
+
+def time_function(function: Callable[[], object], repeats: int, min_repeat_time: float = 0.1) -> BenchmarkResult:
+    """
+    Time a function like timeit, calling it enough times in each repeat to take at least min_repeat_time.
+    """
+    # The first call also warms up caches, e.g TensorFlow traces the prediction function.
+    start = time.perf_counter()
+    function()
+    first_time = time.perf_counter() - start
+
+    number = max(1, int(min_repeat_time / max(first_time, 1e-9)))
+    times = np.asarray(timeit.repeat(function, number=number, repeat=repeats)) / number
+
+    return BenchmarkResult(min=float(np.min(times)),
+                           median=float(np.median(times)),
+                           mean=float(np.mean(times)),
+                           number=number,
+                           repeats=repeats)
+
+
+def create_pipeline_benchmarks(windows_list: List[int], rng: np.random.Generator) -> List[Benchmark]:
+    """
+    Benchmarks of creating the spectrograms and the spectrum painting images for each number of windows.
+    """
+    benchmarks: List[Benchmark] = []
+
+    signal = (rng.standard_normal(number_samples * batch_size) +
+              1j * rng.standard_normal(number_samples * batch_size)).astype(np.complex64)
+    x = signal[:number_samples]
+
+    for windows in windows_list:
+        window_length = number_samples // windows
+
+        spectrogram = create_spectrogram(x, "Z", windows, window_length, nfft).values
+        spectrograms = np.stack([create_spectrogram(signal[i * number_samples:(i + 1) * number_samples], "Z",
+                                                    windows, window_length, nfft).values
+                                 for i in range(batch_size)])
+
+        benchmarks += [
+            (f"create_spectrogram/windows-{windows}",
+             lambda w=windows, wl=window_length: create_spectrogram(x, "Z", w, wl, nfft)),
+            (f"downsample_spectrogram/windows-{windows}",
+             lambda s=spectrogram: sp.downsample_spectrogram(s, options.downsample_resolution)),
+            (f"create_augmented_painted_images/windows-{windows}",
+             lambda s=spectrogram: sp_training.create_augmented_painted_images(s, options)),
+            (f"create_augmented_painted_images_batch-{batch_size}/windows-{windows}",
+             lambda s=spectrograms: sp_training.create_augmented_painted_images_batch(s, options)),
+        ]
+
+    # The stages after downsampling only depend on the resolution.
+    downsampled = sp.downsample_spectrogram(spectrogram, options.downsample_resolution)
+    augmented = sp.augment_spectrogram(downsampled, options.k, options.l, options.d)
+    painted = sp.paint_spectrogram(downsampled, augmented)
+
+    benchmarks += [
+        ("augment_spectrogram", lambda: sp.augment_spectrogram(downsampled, options.k, options.l, options.d)),
+        ("paint_spectrogram", lambda: sp.paint_spectrogram(downsampled, augmented)),
+        ("digitize_spectrogram", lambda: sp.digitize_spectrogram(painted)),
+    ]
+
+    return benchmarks
+
+
+def create_inference_benchmarks(filters_list: List[int], rng: np.random.Generator) -> List[Benchmark]:
+    """
+    Benchmarks of predicting one image with the full model, the quantized TensorFlow Lite model
+    and the TensorFlow Lite model without quantization for each number of filters.
+    """
+    import spectrum_painting_model as sp_model
+    import spectrum_painting_predict as sp_predict
+
+    resolution = options.downsample_resolution
+    image_shape = (resolution, ((resolution - options.l) // options.d) + 1)
+    label_count = 7
+
+    augmented_images = rng.integers(0, 256, size=(calibration_images,) + image_shape, dtype=np.uint8)
+    painted_images = rng.integers(0, 256, size=(calibration_images,) + image_shape, dtype=np.uint8)
+
+    augmented = augmented_images[:1]
+    painted = painted_images[:1]
+
+    benchmarks: List[Benchmark] = []
+
+    for filters in filters_list:
+        model = sp_model.create_tensorflow_model(image_shape, label_count, filters)
+        predict_function = sp_predict.create_full_model_predict_function(model)
+
+        # Single threaded like the Arduino. The random images have no labels so all of them are
+        # used to calibrate the quantization.
+        lite_runner = sp_predict.LiteModelRunner(
+            sp_model.convert_to_tensorflow_lite(model, augmented_images, painted_images, calibration_samples=None),
+            num_threads=1)
+        no_quantization_runner = sp_predict.LiteModelRunner(
+            sp_model.convert_to_tensorflow_lite_no_quantization(model), num_threads=1)
+
+        benchmarks += [
+            (f"predict_full/filters-{filters}",
+             lambda f=predict_function: f(augmented, painted).numpy()),
+            (f"predict_lite/filters-{filters}",
+             lambda r=lite_runner: r.predict(augmented[0], painted[0])),
+            (f"predict_lite_no_quantization/filters-{filters}",
+             lambda r=no_quantization_runner: r.predict(augmented[0], painted[0])),
+        ]
+
+    return benchmarks
+
+
+def run_benchmarks(benchmarks: List[Benchmark], repeats: int, pattern: Optional[str] = None) -> Dict[str, BenchmarkResult]:
+    """
+    :param pattern: Only run the benchmarks with a name that matches this regular expression.
+    """
+    results: Dict[str, BenchmarkResult] = {}
+
+    for (name, function) in benchmarks:
+        if pattern is not None and re.search(pattern, name) is None:
+            continue
+
+        results[name] = time_function(function, repeats)
+        print(f"{name:<60} {results[name].min * 1000:>10.4f} ms")
+
+    return results
+
+
+def get_machine() -> Dict[str, object]:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def save_results(results: Dict[str, BenchmarkResult], file: str):
+    directory = os.path.dirname(file)
+
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+
+    with open(file, "w") as f:
+        json.dump({
+            "version": RESULTS_VERSION,
+            "machine": get_machine(),
+            "results": {name: asdict(result) for (name, result) in results.items()}
+        }, f, indent=2)
+
+
+def load_results(file: str) -> Dict[str, BenchmarkResult]:
+    with open(file, "r") as f:
+        return {name: BenchmarkResult(**result) for (name, result) in json.load(f)["results"].items()}
+
+
+def find_regressions(results: Dict[str, BenchmarkResult],
+                     baseline: Dict[str, BenchmarkResult],
+                     tolerance: float) -> List[str]:
+    """
+    Compare the fastest time of each benchmark with the baseline. The fastest time is the
+    least affected by other processes.
+
+    :param tolerance: The fraction a benchmark can be slower than the baseline, e.g 0.2 for 20%.
+    :return: The names of the benchmarks that are slower than the tolerance allows.
+    """
+    regressions = []
+
+    print(f"{'Benchmark':<60} {'Baseline (ms)':>14} {'Now (ms)':>10} {'Ratio':>7}")
+
+    for (name, result) in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = result.min / baseline[name].min
+        regressed = ratio > 1 + tolerance
+
+        if regressed:
+            regressions.append(name)
+
+        print(f"{name:<60} {baseline[name].min * 1000:>14.4f} {result.min * 1000:>10.4f} {ratio:>6.2f}x"
+              f"{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every stage of the spectrum painting pipeline.")
+    parser.add_argument("--windows", type=int, nargs="+", default=[64, 128, 256, 512, 1024])
+    parser.add_argument("--filters", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--match", type=str, default=None, help="Only run the benchmarks that match this regex.")
+    parser.add_argument("--no-inference", action="store_true", help="Do not benchmark the models.")
+    parser.add_argument("--output", type=str, default=None, help="The JSON file to write the results to.")
+    parser.add_argument("--baseline", type=str, default=None, help="A JSON file written with --output.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(seed=0)
+
+    all_benchmarks = create_pipeline_benchmarks(args.windows, generator)
+
+    if not args.no_inference:
+        all_benchmarks += create_inference_benchmarks(args.filters, generator)
+
+    benchmark_results = run_benchmarks(all_benchmarks, args.repeats, args.match)
+
+    if args.output is not None:
+        save_results(benchmark_results, args.output)
+
+    if args.baseline is not None:
+        slower = find_regressions(benchmark_results, load_results(args.baseline), args.tolerance)
+
+        if len(slower) > 0:
+            print(f"{len(slower)} benchmarks are more than {args.tolerance * 100:.0f}% slower than the baseline")
+            sys.exit(1)
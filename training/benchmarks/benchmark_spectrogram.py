@@ -0,0 +1,36 @@
+import timeit
+
+import numpy as np
+
+from spectrogram import create_spectrogram_per_window, create_spectrograms
+
+# Compare creating spectrograms one window at a time with the batched STFT for
+# the window settings in run-multiple.sh. Run from the training folder with
+# python -m benchmarks.benchmark_spectrogram
+
+number_samples = 65536
+spectrogram_count = 16
+nfft = 64
+repeats = 5
+
+rng = np.random.default_rng(seed=0)
+signal = rng.standard_normal(number_samples * spectrogram_count) + 1j * rng.standard_normal(
+    number_samples * spectrogram_count)
+
+print(f"{'Windows':>8} {'Per window (s)':>15} {'Batched (s)':>12} {'Speedup':>8}")
+
+for num_windows in [64, 128, 256, 512, 1024]:
+    window_length = number_samples // num_windows
+
+    def per_window():
+        for i in range(spectrogram_count):
+            start = i * number_samples
+            create_spectrogram_per_window(signal[start:start + number_samples], "Z", num_windows, window_length, nfft)
+
+    def batched():
+        create_spectrograms(signal, "Z", spectrogram_count, num_windows, window_length, nfft)
+
+    per_window_time = min(timeit.repeat(per_window, number=1, repeat=repeats))
+    batched_time = min(timeit.repeat(batched, number=1, repeat=repeats))
+
+    print(f"{num_windows:>8} {per_window_time:>15.4f} {batched_time:>12.4f} {per_window_time / batched_time:>7.1f}x")
@@ -0,0 +1,54 @@
+import sys
+
+import numpy as np
+
+import spectrum_painting_model as sp_model
+import spectrum_painting_predict as sp_predict
+import spectrum_painting_training as sp_training
+
+# Compare the epoch time and the accuracy of the quantized TensorFlow Lite model
+# when training with the default settings and with FastTrainingOptions.
+# Run from the training folder with
+# python -m benchmarks.benchmark_training <features_dir> [epochs]
+# where features_dir was saved with save_spectrum_painting_features, e.g by spectrum_painting_sweep.py.
+
+features_dir = sys.argv[1]
+epochs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+features = sp_training.load_spectrum_painting_features(features_dir, mmap=False)
+train_test_sets = sp_training.split_spectrum_painting_features(features, test_size=0.3, random_state=0)
+
+image_shape = train_test_sets.x_train_augmented[0].shape
+label_count = len(train_test_sets.label_names)
+
+for (name, fast_options) in [("Default", None),
+                             ("XLA", sp_model.FastTrainingOptions(mixed_precision=None)),
+                             ("XLA + mixed_bfloat16", sp_model.FastTrainingOptions())]:
+    mixed_precision = fast_options.mixed_precision if fast_options is not None else None
+
+    model = sp_model.create_tensorflow_model(image_shape, label_count, mixed_precision=mixed_precision)
+
+    # Do not stop early so every option trains for the same number of epochs.
+    history = sp_model.fit_model(model, train_test_sets, epochs=epochs, early_stopping_patience=epochs,
+                                 fast_options=fast_options)
+
+    if mixed_precision is not None:
+        model = sp_model.create_float32_copy(model, image_shape, label_count)
+
+    lite_model = sp_model.convert_to_tensorflow_lite(model,
+                                                     train_test_sets.x_test_augmented,
+                                                     train_test_sets.x_test_painted,
+                                                     labels=train_test_sets.y_test,
+                                                     snrs=train_test_sets.test_snr)
+
+    predictions = sp_predict.LiteModelRunner(lite_model).predict_batch(train_test_sets.x_test_augmented,
+                                                                       train_test_sets.x_test_painted)
+    lite_accuracy = np.mean(predictions == train_test_sets.y_test)
+
+    # The first epoch includes compiling the model.
+    epoch_times = history.history["epoch_time"]
+
+    print()
+    print(f"{name}: first epoch = {epoch_times[0]:.2f}s, "
+          f"mean epoch after the first = {np.mean(epoch_times[1:]):.2f}s, "
+          f"quantized TFLite accuracy = {lite_accuracy:.3f}")
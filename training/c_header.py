@@ -0,0 +1,102 @@
+from typing import List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# Write arrays as C/C++ headers for the Arduino sketches.
+#
+# The values are formatted in bulk and each header is written with a single write, so
+# large captures and models are written without formatting every value separately.
+
+# "0x00" to "0xff" so bytes can be formatted by indexing.
+_hex_bytes = np.array([f"0x{i:02x}" for i in range(256)])
+
+
+def format_values(values: npt.NDArray, values_per_line: int = 1, indent: str = "    ", hex_bytes: bool = False) -> str:
+    """
+    Format the values of an array like the body of a C array initializer, with a comma
+    after every value except the last and without a newline at the end.
+
+    :param values: Integer values. With hex_bytes they must be unsigned bytes.
+    :param hex_bytes: Format the values as 0x00 like xxd -i.
+    """
+    values = np.asarray(values).reshape(-1)
+
+    if hex_bytes:
+        tokens: List[str] = _hex_bytes[values.astype(np.uint8)].tolist()
+    else:
+        tokens = list(map(str, values.tolist()))
+
+    if values_per_line == 1:
+        lines = tokens
+    else:
+        lines = [", ".join(tokens[i:i + values_per_line]) for i in range(0, len(tokens), values_per_line)]
+
+    if len(lines) == 0:
+        return ""
+
+    return indent + f",\n{indent}".join(lines)
+
+
+def format_array(name: str,
+                 values: npt.NDArray,
+                 c_type: str,
+                 qualifiers: str = "const",
+                 attributes: Optional[List[str]] = None,
+                 alignment: Optional[int] = None,
+                 values_per_line: int = 1,
+                 indent: str = "    ",
+                 hex_bytes: bool = False) -> str:
+    """
+    Format an array definition, e.g const static int8_t real[] PROGMEM = { ... };
+
+    :param qualifiers: The words before the type.
+    :param attributes: The words between the name and the initializer, e.g ["PROGMEM"].
+    :param alignment: Add __attribute__((aligned(alignment))) so the array starts at a multiple of alignment bytes.
+    """
+    attributes = list(attributes) if attributes is not None else []
+
+    if alignment is not None:
+        attributes.append(f"__attribute__((aligned({alignment})))")
+
+    declaration = " ".join([qualifiers, c_type, f"{name}[]"] + attributes)
+    body = format_values(values, values_per_line, indent, hex_bytes)
+
+    if len(body) > 0:
+        body += "\n"
+
+    return f"{declaration} = {{\n{body}}};\n"
+
+
+def format_iq_header(real: npt.NDArray[np.int8], imag: npt.NDArray[np.int8], alignment: Optional[int] = None) -> str:
+    """
+    The contents of data.h with the int8 real and imaginary parts of a capture in program memory.
+    """
+    arrays = [format_array(name, values, "int8_t", qualifiers="const static", attributes=["PROGMEM"],
+                           alignment=alignment)
+              for (name, values) in [("real", real), ("imag", imag)]]
+
+    return "#include <avr/pgmspace.h>\n" + "".join(array + "\n" for array in arrays)
+
+
+def format_model_header(model: bytes,
+                        name: str = "output_spectrum_painting_model_tflite",
+                        alignment: Optional[int] = 16) -> str:
+    """
+    The contents of model.h with a TensorFlow Lite model. This is the same as
+    xxd -n name -i model.tflite | sed -e "s/unsigned/const unsigned/" when alignment is None.
+
+    :param alignment: TensorFlow Lite Micro reads the model in place, so it should be aligned
+                      like the tensor arena.
+    """
+    values = np.frombuffer(model, dtype=np.uint8)
+
+    array = format_array(name, values, "unsigned char", alignment=alignment, values_per_line=12, indent="  ",
+                         hex_bytes=True)
+
+    return array + f"const unsigned int {name}_len = {len(values)};\n"
+
+
+def write_header(file: str, contents: str):
+    with open(file, "w") as f:
+        f.write(contents)
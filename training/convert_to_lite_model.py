@@ -1,9 +1,10 @@
-import time
+import shutil
+import timeit
 
 import tensorflow as tf
 
-import spectrum_painting_data as sp_data
-import spectrum_painting_model as sp_model
+import lite_model_cache
+import spectrogram_cache
 import spectrum_painting_predict as sp_predict
 import spectrum_painting_training as sp_training
 
@@ -12,13 +13,13 @@ full_model = tf.keras.models.load_model('output/spectrum-painting-model-batch-no
 classes = ["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"]
 snr_list = [0, 5, 10, 15, 20, 25, 30]
 
-spectrograms = sp_data.load_spectrograms(data_dir="data/numpy",
-                                         classes=classes,
-                                         snr_list=snr_list,
-                                         windows_per_spectrogram=256,
-                                         window_length=256,
-                                         nfft=64,
-                                         spectrogram_count=10)
+spectrograms = spectrogram_cache.load_spectrograms_cached(data_dir="data/numpy",
+                                                          classes=classes,
+                                                          snr_list=snr_list,
+                                                          windows_per_spectrogram=256,
+                                                          window_length=256,
+                                                          nfft=64,
+                                                          spectrogram_count=10)
 
 spectrum_painting_options = sp_training.SpectrumPaintingTrainingOptions(
     downsample_resolution=64,
@@ -34,26 +35,27 @@ train_test_sets = sp_training.create_spectrum_painting_train_test_sets(
     test_size=0.3
 )
 
-lite_model = sp_model.convert_to_tensorflow_lite(full_model,
-                                                 train_test_sets.x_test_augmented,
-                                                 train_test_sets.x_test_painted)
-print(len(lite_model))
+lite_model = lite_model_cache.convert_to_tensorflow_lite_cached(full_model,
+                                                                train_test_sets.x_test_augmented,
+                                                                train_test_sets.x_test_painted,
+                                                                labels=train_test_sets.y_test,
+                                                                snrs=train_test_sets.test_snr,
+                                                                calibration_samples=20)
+print(lite_model.size)
 
-with open("output/spectrum-painting-model-quant-filters-1.tflite", "wb") as f:
-    f.write(lite_model)
+shutil.copyfile(lite_model.path, "output/spectrum-painting-model-quant-filters-1.tflite")
 
-no_quantization_model = sp_model.convert_to_tensorflow_lite_no_quantization(full_model)
+no_quantization_model = lite_model_cache.convert_to_tensorflow_lite_no_quantization_cached(full_model)
 
-with open("output/spectrum-painting-model-optimize-filters-8.tflite", "wb") as f:
-    f.write(no_quantization_model)
+shutil.copyfile(no_quantization_model.path, "output/spectrum-painting-model-optimize-filters-8.tflite")
 
-print(len(no_quantization_model))
+print(no_quantization_model.size)
 
-start = time.thread_time()
-prediction = sp_predict.predict_lite_no_quant_model(no_quantization_model,
-                                                    x_augmented=train_test_sets.x_test_augmented[0],
-                                                    x_painted=train_test_sets.x_test_painted[0])
-end = time.thread_time()
+# Time one prediction. Use python -m benchmarks.benchmark_pipeline to compare
+# the prediction times of the models with a baseline.
+runner = sp_predict.LiteModelRunner(no_quantization_model.content, num_threads=1)
+prediction_time = min(timeit.repeat(lambda: runner.predict(train_test_sets.x_test_augmented[0],
+                                                           train_test_sets.x_test_painted[0]),
+                                    number=100, repeat=5)) / 100
 
-print("Old = 0.002608")
-print(end - start)
+print(f"Prediction time without quantization = {prediction_time * 1000:.3f} ms")
@@ -0,0 +1,129 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# Quantize I/Q samples to int8 for the Arduino.
+#
+# data.h and the emulated Arduino pipeline in arduino_emulator both use quantize_iq so the
+# model is evaluated on the same inputs that the Arduino gives it.
+
+scaling_modes = ["real_max", "peak_abs", "rms", "percentile"]
+
+INT8_MIN = -128
+INT8_MAX = 127
+
+
+@dataclass
+class QuantizationOptions:
+    """
+    scaling: How the scale of each capture is chosen:
+             real_max: The largest real part becomes full_scale. This is what data.h has always used.
+                       It is the real part of np.max of the complex samples, which is not the peak magnitude,
+                       so the imaginary parts and negative real parts can be outside of the int8 range.
+             peak_abs: The largest absolute value of the real and imaginary parts becomes full_scale.
+             rms: The RMS of the real and imaginary parts becomes full_scale / rms_headroom.
+             percentile: The given percentile of the absolute values of the real and imaginary parts becomes full_scale.
+    full_scale: The value that the scaling statistic is scaled to.
+    saturate: Clip values outside of the int8 range to -128 and 127. Otherwise they wrap around like np.int8.
+    rms_headroom: The ratio of full_scale to the RMS with rms scaling.
+    percentile: The percentile between 0 and 100 with percentile scaling.
+    """
+    scaling: str = "real_max"
+    full_scale: float = 128
+    saturate: bool = False
+    rms_headroom: float = 4.0
+    percentile: float = 99.9
+
+
+@dataclass
+class QuantizedIQ:
+    """
+    real, imag: The quantized samples.
+    scale: The factor each capture was multiplied by, with a length 1 last axis.
+    clipped: The number of real and imaginary parts of each capture that were outside of the int8 range.
+    """
+    real: npt.NDArray[np.int8]
+    imag: npt.NDArray[np.int8]
+    scale: npt.NDArray[np.float64]
+    clipped: npt.NDArray[np.int64]
+
+    @property
+    def clipped_fraction(self) -> npt.NDArray[np.float64]:
+        """
+        The fraction of the real and imaginary parts of each capture that were outside of the int8 range.
+        """
+        return self.clipped / (2 * self.real.shape[-1])
+
+    @property
+    def total_clipped(self) -> int:
+        return int(np.sum(self.clipped))
+
+
+def get_scale(iq: npt.NDArray[np.complex128], options: QuantizationOptions) -> npt.NDArray[np.float64]:
+    """
+    The factor to multiply each row of samples by in float64, with a length 1 last axis.
+    """
+    if options.scaling == "real_max":
+        # The real part of np.max of the complex samples is the largest real part.
+        max_value = np.max(iq.real, axis=-1, keepdims=True)
+
+        return options.full_scale / max_value.astype(np.float64)
+
+    components = np.concatenate((iq.real, iq.imag), axis=-1).astype(np.float64)
+
+    if options.scaling == "peak_abs":
+        statistic = np.max(np.abs(components), axis=-1, keepdims=True)
+        target = options.full_scale
+    elif options.scaling == "rms":
+        statistic = np.sqrt(np.mean(np.square(components), axis=-1, keepdims=True))
+        target = options.full_scale / options.rms_headroom
+    elif options.scaling == "percentile":
+        statistic = np.percentile(np.abs(components), options.percentile, axis=-1, keepdims=True)
+        target = options.full_scale
+    else:
+        raise ValueError(f"The scaling must be one of {scaling_modes}")
+
+    # Leave captures that are all zero unscaled.
+    safe_statistic = np.where(statistic > 0, statistic, target)
+
+    return target / safe_statistic
+
+
+def quantize_iq(iq: npt.NDArray[np.complex128], options: Optional[QuantizationOptions] = None) -> QuantizedIQ:
+    """
+    Scale I/Q samples and convert them to int8. The scaled values are truncated towards zero like np.int8.
+
+    :param iq: The samples of one capture, or a (..., samples) array with one capture per row.
+               Each row is scaled separately.
+    :param options: Defaults to the real_max scaling that wraps around.
+    """
+    if options is None:
+        options = QuantizationOptions()
+
+    iq = np.asarray(iq)
+
+    if not np.iscomplexobj(iq):
+        iq = iq.astype(np.complex128)
+
+    scale = get_scale(iq, options)
+
+    # Multiply in the precision of the samples like save_iq_data always has. The data files are
+    # complex128 so they are scaled in float64. save_iq_data multiplied complex64 samples by a
+    # float64 scalar, which NumPy does in float32, so the scale is rounded to float32 for them.
+    real = iq.real * scale.astype(iq.real.dtype)
+    imag = iq.imag * scale.astype(iq.imag.dtype)
+
+    # Values from -129 to 128 exclusive are truncated to the int8 range.
+    clipped = (np.count_nonzero((real <= INT8_MIN - 1) | (real >= INT8_MAX + 1), axis=-1) +
+               np.count_nonzero((imag <= INT8_MIN - 1) | (imag >= INT8_MAX + 1), axis=-1))
+
+    if options.saturate:
+        real = np.clip(real, INT8_MIN, INT8_MAX)
+        imag = np.clip(imag, INT8_MIN, INT8_MAX)
+
+    return QuantizedIQ(real=real.astype(np.int8),
+                       imag=imag.astype(np.int8),
+                       scale=scale,
+                       clipped=clipped)
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+import tensorflow as tf
+from tensorflow.keras import models
+
+import profiling
+import spectrogram_cache
+import spectrum_painting_model as sp_model
+
+# The version of the cache format. Change this if the way models are
+# converted changes so old cache entries are not used.
+CACHE_VERSION = 1
+
+default_cache_dir = "data/cache/lite-models"
+
+
+@dataclass
+class LiteModelArtifact:
+    """
+    A converted TensorFlow Lite model in the cache.
+
+    path: The path of the .tflite file.
+    size: The size of the .tflite file in bytes.
+    """
+    path: str
+    size: int
+    _content: Optional[bytes] = field(default=None, repr=False)
+
+    @property
+    def content(self) -> bytes:
+        """
+        The contents of the .tflite file. The file is only read the first time this is used.
+        """
+        if self._content is None:
+            with open(self.path, "rb") as f:
+                self._content = f.read()
+
+        return self._content
+
+
+def hash_model_weights(model: models.Model) -> str:
+    """
+    Hash the architecture and the weights of a model. Two models with the same
+    hash convert to the same TensorFlow Lite model.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(model.to_json().encode())
+
+    for weight in model.weights:
+        value = np.ascontiguousarray(weight.numpy())
+        hasher.update(f"{weight.name}:{value.dtype.str}:{value.shape}".encode())
+        hasher.update(value.data)
+
+    return hasher.hexdigest()
+
+
+def hash_calibration_images(augmented_images: List[npt.NDArray[np.uint8]],
+                            painted_images: List[npt.NDArray[np.uint8]],
+                            indices: Optional[npt.NDArray[np.int64]]) -> str:
+    """
+    Hash the images that the quantization is calibrated with.
+
+    :param indices: The calibration images. None means every image.
+    """
+    if indices is None:
+        indices = range(len(augmented_images))
+
+    hasher = hashlib.sha256()
+
+    for i in indices:
+        for image in (augmented_images[i], painted_images[i]):
+            image = np.ascontiguousarray(image)
+            hasher.update(f"{image.dtype.str}:{image.shape}".encode())
+            hasher.update(image.data)
+
+    return hasher.hexdigest()
+
+
+def get_cached_model(key: dict,
+                     convert: Callable[[], bytes],
+                     cache_dir: Optional[str] = None,
+                     max_cache_bytes: int = 1024 ** 3) -> LiteModelArtifact:
+    """
+    Return the cached model for the key or convert it and add it to the cache.
+
+    :param key: Everything the converted model depends on.
+    :param convert: Converts the model if it is not in the cache.
+    :param max_cache_bytes: The least recently used entries are deleted when the cache is bigger than this.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key = dict(key, version=CACHE_VERSION, tensorflow_version=tf.__version__)
+    key_hash = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    entry_dir = os.path.join(cache_dir, key_hash)
+    model_file = os.path.join(entry_dir, "model.tflite")
+
+    if os.path.exists(entry_dir):
+        profiling.count("lite model cache hits")
+
+        # Mark the entry as recently used.
+        os.utime(entry_dir)
+        return LiteModelArtifact(path=model_file, size=os.stat(model_file).st_size)
+
+    profiling.count("lite model cache misses")
+    content = convert()
+
+    # Write to a temporary directory first so a crash never leaves
+    # a partially written entry in the cache.
+    temp_dir = tempfile.mkdtemp(prefix=f".{key_hash}-", dir=cache_dir)
+
+    with open(os.path.join(temp_dir, "model.tflite"), "wb") as f:
+        f.write(content)
+
+    try:
+        os.rename(temp_dir, entry_dir)
+    except OSError:
+        # Another process created the same entry first.
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    spectrogram_cache.evict(cache_dir, max_cache_bytes, keep=key_hash)
+
+    return LiteModelArtifact(path=model_file, size=len(content), _content=content)
+
+
+@profiling.profiled()
+def convert_to_tensorflow_lite_cached(model: models.Model,
+                                      augmented_test_images: List[npt.NDArray[np.uint8]],
+                                      painted_test_images: List[npt.NDArray[np.uint8]],
+                                      labels: Optional[npt.NDArray[np.uint8]] = None,
+                                      snrs: Optional[List[int]] = None,
+                                      calibration_samples: Optional[int] = sp_model.default_calibration_samples,
+                                      seed: int = 0,
+                                      cache_dir: Optional[str] = None) -> LiteModelArtifact:
+    """
+    The same as sp_model.convert_to_tensorflow_lite but the model is only converted if the same
+    weights have not already been converted with the same calibration images.
+    """
+    indices = sp_model.get_calibration_indices(labels, snrs, calibration_samples, seed)
+
+    key = {
+        "converter": "int8",
+        "weights": hash_model_weights(model),
+        "calibration": hash_calibration_images(augmented_test_images, painted_test_images, indices)
+    }
+
+    return get_cached_model(key,
+                            lambda: sp_model.convert_to_tensorflow_lite(model,
+                                                                        augmented_test_images,
+                                                                        painted_test_images,
+                                                                        labels=labels,
+                                                                        snrs=snrs,
+                                                                        calibration_samples=calibration_samples,
+                                                                        seed=seed),
+                            cache_dir)
+
+
+@profiling.profiled()
+def convert_to_tensorflow_lite_no_quantization_cached(model: models.Model,
+                                                      cache_dir: Optional[str] = None) -> LiteModelArtifact:
+    """
+    The same as sp_model.convert_to_tensorflow_lite_no_quantization but the model is only
+    converted if the same weights have not already been converted.
+    """
+    key = {
+        "converter": "no-quantization",
+        "weights": hash_model_weights(model)
+    }
+
+    return get_cached_model(key, lambda: sp_model.convert_to_tensorflow_lite_no_quantization(model), cache_dir)
@@ -1,9 +1,9 @@
 import numpy as np
 from matplotlib import pyplot as plt
 
-from plotting.plotting_utils import read_results, calc_accuracy
+import spectrum_painting_metrics as sp_metrics
 
-results = read_results("../output/results-filters-2.json")
+metrics = sp_metrics.load_metrics("../output/results-filters-2.json")
 
 baseline_accuracy = {
     0: 0.37,
@@ -15,27 +15,10 @@ baseline_accuracy = {
     30: 0.93
 }
 
-y_full_accuracy = []
-y_lite_accuracy = []
-y_baseline_accuracy = []
-x_snr = []
-
-for (snr, result) in results.items():
-    x_snr.append(snr)
-
-    if baseline_accuracy.__contains__(snr):
-        y_baseline_accuracy.append(baseline_accuracy[snr])
-    else:
-        y_baseline_accuracy.append(0)
-
-    y_test = result.get_all_lite_model_labels()
-    predictions = result.get_all_lite_model_predictions()
-
-    full_model_avg_accuracy = calc_accuracy(result.get_all_full_model_labels(), result.get_all_full_model_predictions())
-    y_full_accuracy.append(full_model_avg_accuracy)
-
-    lite_model_avg_accuracy = calc_accuracy(result.get_all_lite_model_labels(), result.get_all_lite_model_predictions())
-    y_lite_accuracy.append(lite_model_avg_accuracy)
+x_snr = metrics.lite.snrs.tolist()
+y_baseline_accuracy = [baseline_accuracy.get(snr, 0) for snr in x_snr]
+y_full_accuracy = metrics.full.accuracy
+y_lite_accuracy = metrics.lite.accuracy
 
 y_ticks = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 x_axis = np.arange(len(x_snr))
@@ -3,24 +3,19 @@ from typing import List
 import numpy as np
 from matplotlib import pyplot as plt
 from seaborn import heatmap
-from sklearn.metrics import confusion_matrix
 
-from plotting.plotting_utils import read_results, calc_accuracy
-from spectrum_painting_result import SpectrumPaintingResult
+import spectrum_painting_metrics as sp_metrics
 
-results = read_results("../output/results-windows-64.json")
+metrics = sp_metrics.load_metrics("../output/results-windows-64.json")
 
 confusion_matrix_snr = 30
-confusion_matrix_result: SpectrumPaintingResult = results[confusion_matrix_snr]
 
 
-def plot_confusion_matrix(y_test,
-                          y_predictions,
+def plot_confusion_matrix(cm: np.ndarray,
                           label_names: List[str]):
-    cm = confusion_matrix(y_test, y_predictions)
-    row_sums = cm.sum(axis=1)[:, np.newaxis]
-
-    cm = (cm.astype(np.float32) / row_sums)
+    """
+    :param cm: The confusion matrix with each row divided by its sum.
+    """
     cm = cm.round(2)
 
     plt.figure(figsize=(4, 4), dpi=160)
@@ -31,15 +26,10 @@ def plot_confusion_matrix(y_test,
     plt.show()
 
 
-def plot_confusion_matrix_standard_deviation(y_test: List[List[int]],
-                                             y_predictions: List[List[int]],
+def plot_confusion_matrix_standard_deviation(model_metrics: sp_metrics.ModelMetrics,
+                                             snr: int,
                                              label_names: List[str]):
-    cms = []
-
-    for i in range(len(y_predictions)):
-        cm = confusion_matrix(y_test[i], y_predictions[i])
-        cm = (cm.astype('float') / cm.sum(axis=1)[:, np.newaxis])
-        cms.append(cm)
+    cms = model_metrics.run_confusion_matrices(snr, normalize=True)
 
     plt.figure(dpi=160)
     heatmap(np.std(cms, axis=0), cmap='Blues', annot=True, xticklabels=label_names, yticklabels=label_names,
@@ -50,28 +40,19 @@ def plot_confusion_matrix_standard_deviation(y_test: List[List[int]],
 
 
 print("Full model")
-plot_confusion_matrix(confusion_matrix_result.get_all_full_model_labels(),
-                      confusion_matrix_result.get_all_full_model_predictions(),
-                      confusion_matrix_result.label_names)
+plot_confusion_matrix(metrics.full.confusion_matrix(confusion_matrix_snr, normalize=True), metrics.label_names)
 
-# plot_confusion_matrix_standard_deviation(confusion_matrix_result.get_all_full_model_labels(),
-#                       confusion_matrix_result.get_all_full_model_predictions(),
-#                       confusion_matrix_result.label_names)
+# plot_confusion_matrix_standard_deviation(metrics.full, confusion_matrix_snr, metrics.label_names)
 
 print("Lite model")
-plot_confusion_matrix(confusion_matrix_result.get_all_lite_model_labels(),
-                      confusion_matrix_result.get_all_lite_model_predictions(),
-                      confusion_matrix_result.label_names)
+plot_confusion_matrix(metrics.lite.confusion_matrix(confusion_matrix_snr, normalize=True), metrics.label_names)
 
 # Plot all confusion matrices
-for (snr, result) in results.items():
+for (i, snr) in enumerate(metrics.lite.snrs):
     print(f"SNR {snr}")
+    print(f"Accuracy = {metrics.lite.accuracy[i]}")
 
-    y_test = result.get_all_lite_model_labels()
-    predictions = result.get_all_lite_model_predictions()
-
-    avg_accuracy = calc_accuracy(y_test, predictions)
-    print(f"Accuracy = {avg_accuracy}")
-
-    plot_confusion_matrix(predictions, y_test, result.label_names)
-    # plot_confusion_matrix_standard_deviation(result.full_model_predictions, result.full_model_labels, result.label_names)
+    # The rows are the predicted labels.
+    cm = metrics.lite.confusion_matrix(snr).T
+    plot_confusion_matrix(cm.astype(np.float32) / cm.sum(axis=1)[:, np.newaxis], metrics.label_names)
+    # plot_confusion_matrix_standard_deviation(metrics.full, snr, metrics.label_names)
@@ -1,27 +1,16 @@
-from typing import Dict, List
-
 import matplotlib.pyplot as plt
 import numpy as np
 
-from plotting.plotting_utils import read_results, calc_accuracy
-from spectrum_painting_result import SpectrumPaintingResult
+import spectrum_painting_metrics as sp_metrics
 
 num_spectrograms = [50, 100, 150, 200, 250, 300, 350, 400, 450, 500]
 
-results: List[Dict[int, SpectrumPaintingResult]] = list(
-    map(lambda n: read_results(f"../output/results-specs-{n}.json"), num_spectrograms))
-
-accuracies_snr_30 = list(
-    map(lambda r: calc_accuracy(r[30].get_all_lite_model_labels(), r[30].get_all_lite_model_predictions()), results))
-
-accuracies_snr_20 = list(
-    map(lambda r: calc_accuracy(r[20].get_all_lite_model_labels(), r[20].get_all_lite_model_predictions()), results))
-
-accuracies_snr_10 = list(
-    map(lambda r: calc_accuracy(r[10].get_all_lite_model_labels(), r[10].get_all_lite_model_predictions()), results))
+lite_metrics = [sp_metrics.load_metrics(f"../output/results-specs-{n}.json").lite for n in num_spectrograms]
 
-accuracies_snr_0 = list(
-    map(lambda r: calc_accuracy(r[0].get_all_lite_model_labels(), r[0].get_all_lite_model_predictions()), results))
+accuracies_snr_30 = [m.accuracy[m.get_snr_index(30)] for m in lite_metrics]
+accuracies_snr_20 = [m.accuracy[m.get_snr_index(20)] for m in lite_metrics]
+accuracies_snr_10 = [m.accuracy[m.get_snr_index(10)] for m in lite_metrics]
+accuracies_snr_0 = [m.accuracy[m.get_snr_index(0)] for m in lite_metrics]
 
 
 def calculate_training_set_size(specs_per_class: int) -> int:
@@ -1,7 +1,7 @@
 import numpy.typing as npt
 from matplotlib import pyplot as plt
 
-import spectrum_painting_data as sp_data
+import spectrogram_cache
 import spectrum_painting_training as sp_training
 from training.spectrum_painting import augment_spectrogram, downsample_spectrogram, paint_spectrogram
 
@@ -15,19 +15,19 @@ spectrum_painting_options = sp_training.SpectrumPaintingTrainingOptions(
     d=4
 )
 
-high_freq_resolution_spec = sp_data.load_spectrograms(data_dir="../data/numpy",
-                                                      classes=classes,
-                                                      snr_list=[snr],
-                                                      windows_per_spectrogram=64,
-                                                      window_length=1024,
-                                                      nfft=64).get(snr)[0].values
+high_freq_resolution_spec = spectrogram_cache.load_spectrograms_cached(data_dir="../data/numpy",
+                                                                       classes=classes,
+                                                                       snr_list=[snr],
+                                                                       windows_per_spectrogram=64,
+                                                                       window_length=1024,
+                                                                       nfft=64).get(snr)[0].values
 
-high_time_resolution_spec = sp_data.load_spectrograms(data_dir="../data/numpy",
-                                                      classes=classes,
-                                                      snr_list=[snr],
-                                                      windows_per_spectrogram=1024,
-                                                      window_length=64,
-                                                      nfft=64).get(snr)[0].values
+high_time_resolution_spec = spectrogram_cache.load_spectrograms_cached(data_dir="../data/numpy",
+                                                                       classes=classes,
+                                                                       snr_list=[snr],
+                                                                       windows_per_spectrogram=1024,
+                                                                       window_length=64,
+                                                                       nfft=64).get(snr)[0].values
 
 fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(8, 4), constrained_layout=True)
 
@@ -57,12 +57,12 @@ fig.supxlabel("Frequency bins")
 fig.supylabel("Time bins")
 plt.show()
 
-spec = sp_data.load_spectrograms(data_dir="../data/numpy",
-                                 classes=classes,
-                                 snr_list=[snr],
-                                 windows_per_spectrogram=256,
-                                 window_length=256,
-                                 nfft=64).get(snr)[0].values
+spec = spectrogram_cache.load_spectrograms_cached(data_dir="../data/numpy",
+                                                  classes=classes,
+                                                  snr_list=[snr],
+                                                  windows_per_spectrogram=256,
+                                                  window_length=256,
+                                                  nfft=64).get(snr)[0].values
 
 fig, axes = plt.subplots(nrows=1, ncols=3, figsize=(4, 4), constrained_layout=True)
 
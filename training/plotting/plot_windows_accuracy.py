@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
-from plotting.plotting_utils import read_results, calc_accuracy
+import spectrum_painting_metrics as sp_metrics
 
 windows = [64, 128, 256, 512, 1024]
 snrs = [0, 5, 10, 15, 20, 25, 30]
@@ -17,12 +17,9 @@ plt.grid()
 markers = ["o", "s", "D", "^", "X"]
 
 for (marker, w) in zip(markers, windows):
-    results = read_results(f"../output/results-windows-{w}.json")
+    lite_metrics = sp_metrics.load_metrics(f"../output/results-windows-{w}.json").lite
 
-    accuracies = list(
-        map(lambda snr: calc_accuracy(results[snr].get_all_lite_model_labels(),
-                                      results[snr].get_all_lite_model_predictions()),
-            snrs))
+    accuracies = [lite_metrics.accuracy[lite_metrics.get_snr_index(snr)] for snr in snrs]
 
     plt.plot(accuracies, label=f"{w} windows", marker=marker)
 
@@ -3,10 +3,20 @@ from typing import List, Dict
 
 import numpy as np
 
+import spectrum_painting_results_store as results_store
 from spectrum_painting_result import SpectrumPaintingResult
 
 
 def read_results(file_name: str) -> Dict[int, SpectrumPaintingResult]:
+    """
+    Read the results of a run, e.g output/results-{run_name}.json. If there is a results
+    store with the same name, e.g output/results-{run_name}, it is read instead of the JSON file.
+    """
+    store_dir = results_store.get_store_dir(file_name)
+
+    if results_store.read_meta(store_dir) is not None:
+        return results_store.ResultsStore(store_dir).to_results()
+
     result_list: List[SpectrumPaintingResult] = []
     results: Dict[int, SpectrumPaintingResult] = {}
 
@@ -0,0 +1,234 @@
+import functools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+# Opt-in timers and counters to find where the time of a run goes.
+#
+# Functions decorated with @profiled and blocks in a profiling.timer are timed, and
+# profiling.count adds to a named counter. Profiling is off unless profiling.enable is
+# called or the SPECTRUM_PAINTING_PROFILE environment variable is set to 1. When it is
+# off a decorated function only checks a flag before calling the function.
+#
+# The times are aggregated per name and every call is also kept as an event so the run
+# can be viewed as a timeline in chrome://tracing or https://ui.perfetto.dev.
+# Only the calls in this process are recorded, not the calls in worker processes.
+
+F = TypeVar("F", bound=Callable)
+
+_enabled = os.environ.get("SPECTRUM_PAINTING_PROFILE", "0") not in ("", "0")
+
+
+@dataclass
+class TimerStats:
+    """
+    The times of every call with the same name in seconds.
+    """
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+
+class Profiler:
+    """
+    Collects the timers, counters and events. Every thread can add to the same profiler.
+    """
+
+    def __init__(self, max_events: int = 1_000_000):
+        """
+        :param max_events: Stop recording events for the trace after this many so long runs do not
+                           run out of memory. The timers and counters are always updated.
+        """
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timers: Dict[str, TimerStats] = {}
+            self.counters: Dict[str, int] = {}
+            # (name, start, duration, thread) of each call and (name, time, value) of each count.
+            self.events: List[Tuple[str, float, float, int]] = []
+            self.counter_events: List[Tuple[str, float, int]] = []
+            self.origin = time.perf_counter()
+
+    def add_time(self, name: str, start: float, end: float):
+        duration = end - start
+
+        with self._lock:
+            stats = self.timers.get(name)
+
+            if stats is None:
+                stats = self.timers[name] = TimerStats()
+
+            stats.count += 1
+            stats.total += duration
+            stats.min = min(stats.min, duration)
+            stats.max = max(stats.max, duration)
+
+            if len(self.events) < self.max_events:
+                self.events.append((name, start, duration, threading.get_ident()))
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+
+            if len(self.counter_events) < self.max_events:
+                self.counter_events.append((name, time.perf_counter(), total))
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            timers = {name: dict(asdict(stats), mean=stats.mean)
+                      for (name, stats) in sorted(self.timers.items(), key=lambda t: -t[1].total)}
+
+            return {
+                "timers": timers,
+                "counters": dict(self.counters)
+            }
+
+    def to_chrome_trace(self) -> dict:
+        """
+        The events in the Chrome trace event format. The times are in microseconds from when the profiler was reset.
+        """
+        pid = os.getpid()
+
+        with self._lock:
+            trace_events = [{
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": thread
+            } for (name, start, duration, thread) in self.events]
+
+            trace_events += [{
+                "name": name,
+                "ph": "C",
+                "ts": (timestamp - self.origin) * 1e6,
+                "pid": pid,
+                "args": {"value": value}
+            } for (name, timestamp, value) in self.counter_events]
+
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+_profiler = Profiler()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def reset():
+    _profiler.reset()
+
+
+class _Timer:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _profiler.add_time(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timer(name: str):
+    """
+    Time a block, e.g with profiling.timer("split"): ...
+    """
+    if not _enabled:
+        return _null_timer
+
+    return _Timer(name)
+
+
+def count(name: str, value: int = 1):
+    """
+    Add to a counter, e.g the number of images that were predicted.
+    """
+    if _enabled:
+        _profiler.count(name, value)
+
+
+def profiled(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Time every call of a function.
+
+    :param name: Defaults to module.function.
+    """
+    def decorator(function: F) -> F:
+        timer_name = name if name is not None else f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _profiler.add_time(timer_name, start, time.perf_counter())
+
+        return wrapper
+
+    return decorator
+
+
+def save(file_prefix: str) -> Tuple[str, str]:
+    """
+    Write the timers and counters to {file_prefix}-profile.json and the events to {file_prefix}-trace.json,
+    e.g output/results-{run_name} to write them next to the results of a run.
+
+    :return: The profile and trace files.
+    """
+    profile_file = f"{file_prefix}-profile.json"
+    trace_file = f"{file_prefix}-trace.json"
+
+    with open(profile_file, "w") as f:
+        json.dump(_profiler.to_dict(), f, indent=2)
+
+    with open(trace_file, "w") as f:
+        json.dump(_profiler.to_chrome_trace(), f)
+
+    return profile_file, trace_file
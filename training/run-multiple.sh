@@ -1,5 +1 @@
-python3 spectrum_painting_repeated_runs.py windows-64 2 -1 64
-python3 spectrum_painting_repeated_runs.py windows-128 2 -1 128
-python3 spectrum_painting_repeated_runs.py windows-256 2 -1 256
-python3 spectrum_painting_repeated_runs.py windows-512 2 -1 512
-python3 spectrum_painting_repeated_runs.py windows-1024 2 -1 1024
\ No newline at end of file
+python3 spectrum_painting_sweep.py --filters 2 --spectrogram-count -1 --num-windows 64 128 256 512 1024 --workers 5
@@ -1,51 +1,112 @@
+import os
 import sys
-from typing import List, TextIO
+from typing import Dict, Optional
 
 import numpy as np
 import numpy.typing as npt
 
+import c_header
+import iq_quantization
 
-def save_iq_data(data: npt.NDArray[np.complex64], windows: int, window_length: int, file: str):
+
+def quantize_iq_data(data: npt.NDArray[np.complex128],
+                     windows: int,
+                     window_length: int,
+                     quantization: Optional[iq_quantization.QuantizationOptions] = None) -> iq_quantization.QuantizedIQ:
+    """
+    Decimate the samples by 4 and scale the first windows * window_length of them to int8.
+
+    :param quantization: Defaults to scaling the largest real part to 128.
+    """
     output_length = windows * window_length
 
     data_offset = 0
 
-    indices = np.arange(0, len(data), step=4)
-    data = data[indices]
-
+    data = data[::4]
     data = data[data_offset:data_offset + output_length]
 
-    max_value = np.max(data).real
+    return iq_quantization.quantize_iq(data, quantization)
+
+
+def save_iq_data(data: npt.NDArray[np.complex128], windows: int, window_length: int, file: str,
+                 alignment: Optional[int] = None,
+                 quantization: Optional[iq_quantization.QuantizationOptions] = None) -> iq_quantization.QuantizedIQ:
+    """
+    Write the I/Q samples the Arduino classifies to data.h.
+
+    :param alignment: Align the arrays to a multiple of this many bytes.
+    :return: The quantized samples with the number of values that were outside of the int8 range.
+    """
+    quantized = quantize_iq_data(data, windows, window_length, quantization)
+
+    c_header.write_header(file, c_header.format_iq_header(quantized.real, quantized.imag, alignment))
+
+    return quantized
+
+
+def save_model(lite_model: bytes, file: str, alignment: Optional[int] = 16):
+    """
+    Write a TensorFlow Lite model to model.h in the same format as xxd -i.
+    """
+    c_header.write_header(file, c_header.format_model_header(lite_model, alignment=alignment))
+
+
+def save_arduino_headers(data: npt.NDArray[np.complex64],
+                         windows: int,
+                         window_length: int,
+                         lite_model: bytes,
+                         directory: str = "../arduino/spectrum_painting",
+                         quantization: Optional[iq_quantization.QuantizationOptions] = None
+                         ) -> iq_quantization.QuantizedIQ:
+    """
+    Write data.h and model.h for the spectrum painting sketch.
+    """
+    save_model(lite_model, os.path.join(directory, "model.h"))
+
+    return save_iq_data(data, windows, window_length, os.path.join(directory, "data.h"), quantization=quantization)
+
 
-    # Scale the data to be between -128 and 128 so it fits in a signed 8-bit integer
-    data_scale_factor: float = 128 / max_value
-    data = data * data_scale_factor
+def save_iq_data_batch(captures: Dict[str, npt.NDArray[np.complex64]],
+                       windows: int,
+                       window_length: int,
+                       directory: str,
+                       quantization: Optional[iq_quantization.QuantizationOptions] = None
+                       ) -> Dict[str, iq_quantization.QuantizedIQ]:
+    """
+    Write a data.h file for each of many captures, e.g to flash the Arduino with each test capture in turn.
 
-    real_list: List[str] = []
-    imag_list: List[str] = []
+    :param captures: Maps the name of each header file without the extension to the samples.
+    :return: Maps each header file to its quantized samples.
+    """
+    os.makedirs(directory, exist_ok=True)
 
-    def format_num(n) -> str:
-        # return np.format_float_positional(np.float16(n))
-        return str(np.int8(n))
+    quantized = {}
 
-    for n in data:
-        real_list.append(format_num(n.real))
-        imag_list.append(format_num(n.imag))
+    for (name, data) in captures.items():
+        file = os.path.join(directory, f"{name}.h")
+        quantized[file] = save_iq_data(data, windows, window_length, file, quantization=quantization)
 
-    with open(file, "w") as f:
-        f.write("#include <avr/pgmspace.h>\n")
+    return quantized
 
-        write_variable(real_list, f, "real", "int8_t")
-        write_variable(imag_list, f, "imag", "int8_t")
 
+if __name__ == "__main__":
+    # Write a header for each capture, e.g
+    # python save_iq_data_for_arduino.py output/headers 256 256 data/numpy/SNR30_*.npy
+    # Set SCALING to one of iq_quantization.scaling_modes to saturate instead of wrapping.
+    output_directory = sys.argv[1]
+    windows_arg = int(sys.argv[2])
+    window_length_arg = int(sys.argv[3])
 
-def write_variable(x: List, f: TextIO, name: str, type: str):
-    f.write(f"const static {type} {name}[] PROGMEM = " + "{\n")
+    scaling = os.environ.get("SCALING")
+    quantization_options = None if scaling is None else iq_quantization.QuantizationOptions(scaling=scaling,
+                                                                                            full_scale=127,
+                                                                                            saturate=True)
 
-    for (i, n) in enumerate(x):
-        f.write(f"    {n}")
+    iq_files = sys.argv[4:]
+    iq_captures = {os.path.splitext(os.path.basename(f))[0]: np.load(f, mmap_mode="r") for f in iq_files}
 
-        if i < len(x) - 1:
-            f.write(",\n")
+    batch = save_iq_data_batch(iq_captures, windows_arg, window_length_arg, output_directory, quantization_options)
 
-    f.write("\n};\n\n")
\ No newline at end of file
+    for (header_file, quantized_iq) in batch.items():
+        print(f"{header_file}: {quantized_iq.total_clipped} values clipped "
+              f"({float(quantized_iq.clipped_fraction) * 100:.3f}%)")
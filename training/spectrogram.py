@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 import numpy.typing as npt
@@ -26,6 +26,46 @@ def move_front_half_to_end(array: npt.NDArray) -> npt.NDArray:
     return np.concatenate((array[n // 2:], array[:n // 2]))
 
 
+def create_spectrogram_values(x: npt.NDArray[np.complex64],
+                              windows: int,
+                              window_length: int,
+                              nfft: int,
+                              dtype: npt.DTypeLike = np.float32,
+                              out: Optional[npt.NDArray] = None) -> npt.NDArray:
+    """
+    Batched version of the simplified STFT. Instead of calling the FFT once per window the
+    samples are reshaped into a (windows, window_length) view so all the windows are
+    transformed with a single multi-row FFT. The magnitudes are written directly into the
+    output array with the two halves swapped, which is the same as calling
+    move_front_half_to_end on every row.
+
+    :param x: The signal. This can be a 1D array of samples or a stack of signals with shape
+              (..., windows * window_length) to create many spectrograms at once.
+    :param dtype: The data type of the spectrogram values.
+    :param out: An optional preallocated array with shape (..., windows, nfft) to write the values to.
+    :return: The spectrogram values with shape (..., windows, nfft).
+    """
+    samples = windows * window_length
+    x = np.asarray(x)
+    batch_shape = x.shape[:-1]
+
+    # Reshaping a slice of a strided view does not copy the samples.
+    frames = x[..., :samples].reshape(batch_shape + (windows, window_length))
+
+    if out is None:
+        out = np.empty(shape=batch_shape + (windows, nfft), dtype=dtype)
+
+    result = fft(frames, norm="backward", n=nfft, axis=-1)
+
+    # For some reason our spectrogram has the negative frequencies in
+    # the *last* half of the data so the halves are swapped when taking the magnitude.
+    middle = nfft // 2
+    np.abs(result[..., middle:], out=out[..., :nfft - middle])
+    np.abs(result[..., :middle], out=out[..., nfft - middle:])
+
+    return out
+
+
 def create_spectrogram(x: npt.NDArray[np.complex64],
                        label: str,
                        windows: int,
@@ -37,6 +77,21 @@ def create_spectrogram(x: npt.NDArray[np.complex64],
     :param x: The signal
     :return: A Spectrogram instance that contains the frequencies, time and values.
     """
+    # Use float64 so the values are identical to computing each window separately.
+    spectrogram_values = create_spectrogram_values(x, windows, window_length, nfft, dtype=np.float64)
+
+    return Spectrogram(values=spectrogram_values, label=label)
+
+
+def create_spectrogram_per_window(x: npt.NDArray[np.complex64],
+                                  label: str,
+                                  windows: int,
+                                  window_length: int,
+                                  nfft: int) -> Spectrogram:
+    """
+    Create a spectrogram by computing the FFT of each window separately, which is
+    how the Arduino does it. This is kept as a reference for create_spectrogram_values.
+    """
     spectrogram_values = np.empty(shape=(windows, nfft))
 
     for w in range(windows):
@@ -62,6 +117,28 @@ def create_spectrogram(x: npt.NDArray[np.complex64],
     return Spectrogram(values=spectrogram_values, label=label)
 
 
+def create_spectrograms(x: npt.NDArray[np.complex64],
+                        label: str,
+                        count: int,
+                        windows: int,
+                        window_length: int,
+                        nfft: int,
+                        dtype: npt.DTypeLike = np.float64) -> List[Spectrogram]:
+    """
+    Create consecutive spectrograms from a signal in one batch.
+
+    :param x: The signal.
+    :param count: The number of spectrograms to create. Each one uses windows * window_length samples.
+    :return: A list of Spectrograms. The values of each spectrogram are views into one array.
+    """
+    samples_per_spectrogram = windows * window_length
+    slices = np.asarray(x)[:count * samples_per_spectrogram].reshape((count, samples_per_spectrogram))
+
+    values = create_spectrogram_values(slices, windows, window_length, nfft, dtype=dtype)
+
+    return [Spectrogram(values=v, label=label) for v in values]
+
+
 def split_spectrogram(spectrogram: npt.NDArray, duration: int) -> List[npt.NDArray]:
     """
     Split up a spectrogram along the time axis into a bunch of smaller spectrograms.
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import profiling
+import spectrum_painting_data as sp_data
+from spectrogram import Spectrogram
+
+# The version of the cache format. Change this if the way spectrograms are
+# created changes so old cache entries are not used.
+CACHE_VERSION = 1
+
+
+def get_default_cache_dir(data_dir: str) -> str:
+    """
+    The cache is stored next to the data directory, e.g data/numpy is cached in data/cache/spectrograms.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(data_dir)), "cache", "spectrograms")
+
+
+def get_cache_key(files: List[sp_data.SpectrogramFile],
+                  windows_per_spectrogram: int,
+                  window_length: int,
+                  nfft: int) -> str:
+    """
+    Create a key for a set of spectrograms from the STFT parameters and the
+    size and modification time of every source file. If a data file is
+    regenerated the key changes.
+    """
+    source_files = []
+
+    for spectrogram_file in files:
+        stat = os.stat(spectrogram_file.file)
+        source_files.append([os.path.basename(spectrogram_file.file),
+                             spectrogram_file.snr,
+                             spectrogram_file.label,
+                             spectrogram_file.count,
+                             stat.st_size,
+                             stat.st_mtime_ns])
+
+    key = {
+        "version": CACHE_VERSION,
+        "windows_per_spectrogram": windows_per_spectrogram,
+        "window_length": window_length,
+        "nfft": nfft,
+        "files": source_files
+    }
+
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def evict(cache_dir: str, max_bytes: int, keep: Optional[str] = None):
+    """
+    Delete the least recently used entries until the cache is smaller than max_bytes.
+
+    :param keep: The key of an entry that must not be deleted.
+    """
+    entries = []
+
+    for entry in os.scandir(cache_dir):
+        # Skip entries that are still being written.
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+
+        size = sum(f.stat().st_size for f in os.scandir(entry.path))
+        entries.append((entry.stat().st_mtime, size, entry.path, entry.name))
+
+    total_size = sum(size for (_, size, _, _) in entries)
+
+    # Oldest first
+    for (_, size, path, key) in sorted(entries):
+        if total_size <= max_bytes:
+            break
+
+        if key == keep:
+            continue
+
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+
+@profiling.profiled()
+def load_spectrograms_cached(data_dir: str,
+                             classes: List[str],
+                             snr_list: List[int],
+                             windows_per_spectrogram: int,
+                             window_length: int,
+                             nfft: int,
+                             spectrogram_count: int = -1,
+                             cache_dir: Optional[str] = None,
+                             max_cache_bytes: int = 20 * 1024 ** 3) -> Dict[int, List[Spectrogram]]:
+    """
+    The same as sp_data.load_spectrograms but the spectrograms are stored on disk the first time
+    so calling it again with the same arguments does not compute any FFTs.
+
+    The values of the returned spectrograms are read-only views of a memory-mapped .npy file
+    so only the spectrograms that are used are read from disk.
+
+    :param cache_dir: Where to store the spectrograms. Defaults to data/cache/spectrograms next to the data directory.
+    :param max_cache_bytes: The least recently used entries are deleted when the cache is bigger than this.
+    """
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir(data_dir)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    files = sp_data.get_spectrogram_files(data_dir,
+                                          classes,
+                                          snr_list,
+                                          windows_per_spectrogram * window_length,
+                                          spectrogram_count)
+
+    key = get_cache_key(files, windows_per_spectrogram, window_length, nfft)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if not os.path.exists(entry_dir):
+        profiling.count("spectrogram cache misses")
+
+        # Write to a temporary directory first so a crash never leaves
+        # a partially written entry in the cache.
+        temp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+        shape = (sum(f.count for f in files), windows_per_spectrogram, nfft)
+        values = np.lib.format.open_memmap(os.path.join(temp_dir, "values.npy"),
+                                           mode="w+",
+                                           dtype=np.float64,
+                                           shape=shape)
+
+        for spectrogram_file in files:
+            sp_data.write_spectrogram_values(spectrogram_file, values, windows_per_spectrogram, window_length, nfft)
+
+        values.flush()
+        del values
+
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # Another process created the same entry first.
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        evict(cache_dir, max_cache_bytes, keep=key)
+    else:
+        profiling.count("spectrogram cache hits")
+
+        # Mark the entry as recently used.
+        os.utime(entry_dir)
+
+    values = np.load(os.path.join(entry_dir, "values.npy"), mmap_mode="r")
+
+    return sp_data.spectrograms_from_values(files, values, snr_list)
@@ -1,5 +1,6 @@
 import numpy as np
 import numpy.typing as npt
+from numpy.lib.stride_tricks import sliding_window_view
 from skimage.transform import downscale_local_mean
 
 
@@ -7,20 +8,23 @@ def downsample_spectrogram(spectrogram: npt.NDArray, resolution: int) -> npt.NDA
     """
     Downsample a spectrogram to a target N x N resolution.
 
-    :param spectrogram: A 2D array of a spectrogram. 
+    :param spectrogram: A 2D array of a spectrogram, or a stack of spectrograms with shape (batch, height, width).
     :arg resolution: The target height/width of the image in pixels.
     :return: The downsampled spectrogram.
     """
 
-    (height, width) = spectrogram.shape
+    (height, width) = spectrogram.shape[-2:]
     time_factor = width // resolution
     freq_factor = height // resolution
-    downsampled_spec_values = downscale_local_mean(spectrogram, (freq_factor, time_factor))[:resolution, :resolution]
+
+    # Do not downsample along the batch axis.
+    factors = (1,) * (spectrogram.ndim - 2) + (freq_factor, time_factor)
+    downsampled_spec_values = downscale_local_mean(spectrogram, factors)[..., :resolution, :resolution]
 
     # make sure the spectrogram is still in the correct orientation
     # downsampled_spec_values = np.flip(downsampled_spec_values, axis=0)
 
-    assert downsampled_spec_values.shape == (resolution, resolution)
+    assert downsampled_spec_values.shape[-2:] == (resolution, resolution)
     return downsampled_spec_values
 
 
@@ -28,6 +32,44 @@ def augment_spectrogram(spectrogram: npt.NDArray, k: int, l: int, d: int) -> npt
     """
     Augment the Bluetooth and Zigbee signals by stretching them.
 
+    :param spectrogram: An M x N array of signal magnitude values, or a stack of them
+                        with shape (batch, M, N) to augment many spectrograms at once.
+    :param k: The number of maximum values
+    :param l: The sliding window size
+    :param d: The step size
+    """
+    spectrograms = np.asarray(spectrogram)
+    freq_bins = spectrograms.shape[-1]
+
+    # The mean of each spectrogram. Reshaping to one row per spectrogram
+    # sums the values in the same order as np.mean of a single spectrogram.
+    m = np.mean(spectrograms.reshape(spectrograms.shape[:-2] + (-1,)), axis=-1)
+
+    # Every window of length L that starts at a multiple of D along the frequency axis.
+    windows = sliding_window_view(spectrograms, l, axis=-1)[..., :freq_bins - l + 1:d, :]
+
+    # Get the top K elements of each window. The top K are sorted afterwards so they are
+    # summed in the same order as sorting the whole window.
+    top_k = np.partition(windows, l - k, axis=-1)[..., l - k:]
+    top_k.sort(axis=-1)
+    mean_top_k = np.mean(top_k, axis=-1)
+
+    # The loop writes the mean back into the spectrogram copy before subtracting the mean
+    # so the value is rounded to the data type of the spectrogram. The value it writes is
+    # never part of a later window so this is the only effect it has on the output.
+    mean_top_k = mean_top_k.astype(spectrograms.dtype)
+
+    augmented_spectrogram = np.empty(shape=mean_top_k.shape, dtype=np.float32)
+    np.subtract(mean_top_k, m[..., np.newaxis, np.newaxis], out=augmented_spectrogram, casting="same_kind")
+
+    return augmented_spectrogram.clip(min=0)
+
+
+def augment_spectrogram_loop(spectrogram: npt.NDArray, k: int, l: int, d: int) -> npt.NDArray:
+    """
+    Augment the Bluetooth and Zigbee signals by stretching them. This loops over every
+    window in the same way as the Arduino and is kept as a reference for augment_spectrogram.
+
     :param spectrogram: An M x N array of signal magnitude values.
     :param k: The number of maximum values
     :param l: The sliding window size
@@ -63,11 +105,19 @@ def augment_spectrogram(spectrogram: npt.NDArray, k: int, l: int, d: int) -> npt
 
 
 def paint_spectrogram(original: npt.NDArray, augmented: npt.NDArray) -> npt.NDArray:
-    painted_spectrogram = np.zeros(shape=augmented.shape)
-    mean_original_rows = np.mean(original, axis=1)
+    """
+    Subtract the mean of each row of the original spectrogram from the augmented spectrogram.
+    This also works on a stack of spectrograms with shape (batch, M, N).
+    """
+    mean_original_rows = np.mean(original, axis=-1)
 
-    for row in range(len(augmented)):
-        painted_spectrogram[row] = augmented[row] - mean_original_rows[row]
+    # Subtract with the same precision as subtracting the mean of a row as a scalar
+    # but store the result as float64.
+    painted_spectrogram = np.empty(shape=augmented.shape, dtype=np.float64)
+    np.subtract(augmented,
+                mean_original_rows[..., np.newaxis],
+                out=painted_spectrogram,
+                dtype=np.result_type(augmented, mean_original_rows.dtype.type(0)))
 
     # clip the values so they are all positive
     return painted_spectrogram.clip(min=0)
@@ -76,9 +126,31 @@ def paint_spectrogram(original: npt.NDArray, augmented: npt.NDArray) -> npt.NDAr
 def digitize_spectrogram(spectrogram: npt.NDArray[np.float32]) -> npt.NDArray[np.uint8]:
     """
     Digitize the spectrogram from a range of floating point numbers to discrete integers.
+    Each spectrogram is scaled by its own maximum value so a stack of spectrograms
+    with shape (batch, M, N) can be digitized at once.
 
     :param spectrogram: The spectrogram to digitize.
     """
+    max_values = spectrogram.max(axis=(-2, -1), keepdims=True)
+
+    # Divide in float64 like dividing 255 by a scalar maximum value, then multiply in the precision of
+    # a floating point spectrogram, or in float64 for an integer spectrogram, like multiplying by that scalar.
+    scale = np.zeros(shape=max_values.shape, dtype=np.float64)
+    np.divide(255, max_values, out=scale, where=max_values != 0, dtype=np.float64)
+
+    scale_dtype = spectrogram.dtype if np.issubdtype(spectrogram.dtype, np.floating) else np.float64
+    scaled_spectrogram = spectrogram.clip(min=0) * scale.astype(scale_dtype)
+
+    return scaled_spectrogram.astype(np.uint8)
+
+
+def digitize_spectrogram_single(spectrogram: npt.NDArray[np.float32]) -> npt.NDArray[np.uint8]:
+    """
+    Digitize one spectrogram by scaling it with its maximum value as a scalar. This is kept as a
+    reference for digitize_spectrogram.
+
+    :param spectrogram: The M x N spectrogram to digitize.
+    """
     max_value: float = spectrogram.max()
     scaled_spectrogram: npt.NDArray = np.zeros(spectrogram.shape)
 
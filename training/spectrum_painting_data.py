@@ -1,10 +1,14 @@
-from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import numpy.typing as npt
 import scipy.io as sio
 
-from spectrogram import Spectrogram, create_spectrogram
+import profiling
+from spectrogram import Spectrogram, create_spectrograms, create_spectrogram_values
 
 
 def load_data_from_matlab(file: str) -> npt.NDArray[np.complex128]:
@@ -33,13 +37,32 @@ def convert_matlab_to_numpy(matlab_dir: str,
             np.save(f"{numpy_dir}/SNR{snr}_{c}.npy", data)
 
 
+def load_decimated_iq_data(file: str, mmap: bool = True) -> npt.NDArray[np.complex128]:
+    """
+    Load the I/Q samples from a .npy file and keep every 4th sample.
+
+    Using a step size of 4 reduces the number of I/Q samples.
+    This also has the knock-on effect of only outputting
+    frequencies in the FFT that are between +-22 MHz. This means
+    the Wi-Fi signal fills the spectrogram.
+
+    :param mmap: Whether to memory-map the file. The decimated samples are then a strided view
+                 of the file so only the pages that are read are loaded into memory.
+    """
+    data = np.load(file, mmap_mode="r" if mmap else None)
+    return data[::4]
+
+
+@profiling.profiled()
 def load_spectrograms(data_dir: str,
                       classes: List[str],
                       snr_list: List[int],
                       windows_per_spectrogram: int,
                       window_length: int,
                       nfft: int,
-                      spectrogram_count: int = -1) -> Dict[int, List[Spectrogram]]:
+                      spectrogram_count: int = -1,
+                      mmap: bool = True,
+                      chunk_size: int = 256) -> Dict[int, List[Spectrogram]]:
     """
     Read the time-domain data and convert it to spectrograms.
 
@@ -50,6 +73,8 @@ def load_spectrograms(data_dir: str,
     :param classes: The classes to load.
     :param snr_list: The signal-to-noise ratios to load.
     :param window_length: The length of each window to perform the FFT on.
+    :param mmap: Whether to memory-map the data files instead of reading them into memory.
+    :param chunk_size: The maximum number of spectrograms to create in one batched FFT.
 
     :return: A dictionary that maps each SNR to a list of Spectrograms.
     """
@@ -59,14 +84,7 @@ def load_spectrograms(data_dir: str,
         spectrograms[snr] = []
 
         for label in classes:
-            data = np.load(f"{data_dir}/SNR{snr}_{label}.npy")
-
-            # Use a step size of 4 to reduce the number of I/Q samples.
-            # This also has the knock-on effect of only outputting
-            # frequencies in the FFT that are between +-22 MHz. This means
-            # the Wi-Fi signal fills the spectrogram.
-            indices = np.arange(0, len(data), step=4)
-            data = data[indices]
+            data = load_decimated_iq_data(f"{data_dir}/SNR{snr}_{label}.npy", mmap)
 
             samples_per_spectrogram = windows_per_spectrogram * window_length
             spectrogram_count = spectrogram_count
@@ -74,14 +92,202 @@ def load_spectrograms(data_dir: str,
             if spectrogram_count == -1:
                 spectrogram_count = len(data) // samples_per_spectrogram
 
-            for i in range(spectrogram_count):
-                start = i * samples_per_spectrogram
-                end = start + samples_per_spectrogram
-                data_slice = data[start:end]
+            # Create the spectrograms for this file in chunks so the complex FFT output
+            # of a whole file is never in memory at once.
+            for chunk_start in range(0, spectrogram_count, chunk_size):
+                count = min(chunk_size, spectrogram_count - chunk_start)
+                start = chunk_start * samples_per_spectrogram
+                end = start + (count * samples_per_spectrogram)
 
-                spectrogram = create_spectrogram(data_slice, label, windows_per_spectrogram, window_length, nfft)
-                spectrograms[snr].append(spectrogram)
+                spectrograms[snr].extend(create_spectrograms(data[start:end],
+                                                             label,
+                                                             count,
+                                                             windows_per_spectrogram,
+                                                             window_length,
+                                                             nfft))
 
             del data
 
     return spectrograms
+
+
+@dataclass
+class SpectrogramFile:
+    """
+    Where the spectrograms of one data file are stored in an array of all the spectrograms.
+
+    offset: The index of the first spectrogram of this file in the output.
+    count: The number of spectrograms created from this file.
+    """
+    snr: int
+    label: str
+    file: str
+    offset: int
+    count: int
+
+
+def get_spectrogram_files(data_dir: str,
+                          classes: List[str],
+                          snr_list: List[int],
+                          samples_per_spectrogram: int,
+                          spectrogram_count: int = -1) -> List[SpectrogramFile]:
+    """
+    List the data files in the same order as load_spectrograms and work out where the
+    spectrograms of each file go in one array of all the spectrograms.
+    """
+    files: List[SpectrogramFile] = []
+    offset = 0
+
+    for snr in snr_list:
+        for label in classes:
+            file = f"{data_dir}/SNR{snr}_{label}.npy"
+
+            # Same as load_spectrograms, the count of the first file is used
+            # for every other file.
+            if spectrogram_count == -1:
+                spectrogram_count = len(load_decimated_iq_data(file, mmap=True)) // samples_per_spectrogram
+
+            files.append(SpectrogramFile(snr=snr, label=label, file=file, offset=offset, count=spectrogram_count))
+            offset += spectrogram_count
+
+    return files
+
+
+def write_spectrogram_values(spectrogram_file: SpectrogramFile,
+                             output: npt.NDArray,
+                             windows_per_spectrogram: int,
+                             window_length: int,
+                             nfft: int,
+                             first_spectrogram: int = 0,
+                             count: int = -1,
+                             mmap: bool = True,
+                             chunk_size: int = 256):
+    """
+    Create the spectrograms of one data file and write them to their place in the output array.
+
+    :param output: An array with shape (total spectrograms, windows_per_spectrogram, nfft).
+    :param first_spectrogram: The index of the first spectrogram in the file to create.
+    :param count: The number of spectrograms to create. -1 creates all the remaining spectrograms of the file.
+    """
+    if count == -1:
+        count = spectrogram_file.count - first_spectrogram
+
+    data = load_decimated_iq_data(spectrogram_file.file, mmap)
+    samples_per_spectrogram = windows_per_spectrogram * window_length
+
+    for chunk_start in range(first_spectrogram, first_spectrogram + count, chunk_size):
+        chunk_count = min(chunk_size, first_spectrogram + count - chunk_start)
+        start = chunk_start * samples_per_spectrogram
+        end = start + (chunk_count * samples_per_spectrogram)
+        output_start = spectrogram_file.offset + chunk_start
+
+        create_spectrogram_values(data[start:end].reshape((chunk_count, samples_per_spectrogram)),
+                                  windows_per_spectrogram,
+                                  window_length,
+                                  nfft,
+                                  out=output[output_start:output_start + chunk_count])
+
+    del data
+
+
+def _create_spectrograms_in_shared_memory(spectrogram_file: SpectrogramFile,
+                                          shared_memory_name: str,
+                                          shape: Tuple[int, int, int],
+                                          first_spectrogram: int,
+                                          count: int,
+                                          window_length: int,
+                                          mmap: bool):
+    """
+    Worker for load_spectrograms_parallel. This writes the spectrograms straight into the
+    shared output array so nothing has to be pickled back to the parent process.
+    """
+    output_memory = shared_memory.SharedMemory(name=shared_memory_name)
+    output = np.ndarray(shape=shape, dtype=np.float64, buffer=output_memory.buf)
+
+    try:
+        (_, windows_per_spectrogram, nfft) = shape
+        write_spectrogram_values(spectrogram_file,
+                                 output,
+                                 windows_per_spectrogram,
+                                 window_length,
+                                 nfft,
+                                 first_spectrogram=first_spectrogram,
+                                 count=count,
+                                 mmap=mmap,
+                                 chunk_size=count)
+    finally:
+        del output
+        output_memory.close()
+
+
+@profiling.profiled()
+def load_spectrograms_parallel(data_dir: str,
+                               classes: List[str],
+                               snr_list: List[int],
+                               windows_per_spectrogram: int,
+                               window_length: int,
+                               nfft: int,
+                               spectrogram_count: int = -1,
+                               mmap: bool = True,
+                               chunk_size: int = 256,
+                               workers: Optional[int] = None) -> Dict[int, List[Spectrogram]]:
+    """
+    The same as load_spectrograms but the spectrograms are created by a pool of processes.
+    Each file is split into chunks of at most chunk_size spectrograms and every chunk is
+    a separate task. The workers write the values into one shared memory array so
+    the returned spectrograms are in the same order as load_spectrograms.
+
+    :param workers: The number of processes to use. Defaults to the number of CPUs.
+    """
+    files = get_spectrogram_files(data_dir,
+                                  classes,
+                                  snr_list,
+                                  windows_per_spectrogram * window_length,
+                                  spectrogram_count)
+
+    total_count = sum(f.count for f in files)
+    shape = (total_count, windows_per_spectrogram, nfft)
+    output_memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+
+            for spectrogram_file in files:
+                for chunk_start in range(0, spectrogram_file.count, chunk_size):
+                    futures.append(executor.submit(_create_spectrograms_in_shared_memory,
+                                                   spectrogram_file,
+                                                   output_memory.name,
+                                                   shape,
+                                                   chunk_start,
+                                                   min(chunk_size, spectrogram_file.count - chunk_start),
+                                                   window_length,
+                                                   mmap))
+
+            for future in futures:
+                # Raise any exceptions from the workers.
+                future.result()
+
+        # Copy the values out of the shared memory so it can be released.
+        values = np.array(np.ndarray(shape=shape, dtype=np.float64, buffer=output_memory.buf))
+    finally:
+        output_memory.close()
+        output_memory.unlink()
+
+    return spectrograms_from_values(files, values, snr_list)
+
+
+def spectrograms_from_values(files: List[SpectrogramFile],
+                             values: npt.NDArray,
+                             snr_list: List[int]) -> Dict[int, List[Spectrogram]]:
+    """
+    Create the dictionary returned by load_spectrograms from one array of all the spectrogram values.
+    The values of each Spectrogram are a view into the array.
+    """
+    spectrograms: Dict[int, List[Spectrogram]] = {snr: [] for snr in snr_list}
+
+    for spectrogram_file in files:
+        for i in range(spectrogram_file.offset, spectrogram_file.offset + spectrogram_file.count):
+            spectrograms[spectrogram_file.snr].append(Spectrogram(values=values[i], label=spectrogram_file.label))
+
+    return spectrograms
@@ -0,0 +1,244 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+import spectrum_painting_results_store as results_store
+
+
+@dataclass
+class ResultColumns:
+    """
+    Every prediction in a results file as flat arrays with one element per prediction.
+
+    model: The index of the model type in results_store.model_types.
+    sizes: Maps (run, snr, model type) to the size of the model.
+    """
+    labels: npt.NDArray[np.uint8]
+    predictions: npt.NDArray[np.uint8]
+    snr: npt.NDArray[np.int64]
+    run: npt.NDArray[np.int64]
+    model: npt.NDArray[np.uint8]
+    label_names: List[str]
+    sizes: Dict[Tuple[int, int, str], int]
+
+
+def read_result_columns(file_name: str) -> ResultColumns:
+    """
+    Read a results-{run_name}.json file or the results store with the same name as arrays.
+    The i-th result of every SNR in a JSON file is run i.
+    """
+    store_dir = results_store.get_store_dir(file_name)
+
+    if results_store.read_meta(store_dir) is not None:
+        store = results_store.ResultsStore(store_dir)
+
+        return ResultColumns(labels=np.asarray(store.column("label")),
+                             predictions=np.asarray(store.column("prediction")),
+                             snr=store.column("snr"),
+                             run=store.column("run"),
+                             model=store.column("model"),
+                             label_names=store.label_names,
+                             sizes={(r["run"], r["snr"], r["model"]): r["size"] for r in store.records})
+
+    with open(file_name, "r") as f:
+        result_list = json.load(f)["results"]
+
+    labels = []
+    predictions = []
+    counts = []
+    snr = []
+    run = []
+    model = []
+    sizes = {}
+
+    # Read the lists straight from the JSON rather than creating every ModelResult.
+    for result in result_list:
+        for (model_index, model_type) in enumerate(results_store.model_types):
+            for (i, model_result) in enumerate(result[f"{model_type}_model_results"]):
+                labels.append(model_result["labels"])
+                predictions.append(model_result["predictions"])
+                counts.append(len(model_result["labels"]))
+                snr.append(result["snr"])
+                run.append(i)
+                model.append(model_index)
+                sizes[(i, result["snr"], model_type)] = model_result["size"]
+
+    label_names = result_list[0]["label_names"] if len(result_list) > 0 else []
+
+    return ResultColumns(labels=np.fromiter((v for values in labels for v in values), dtype=np.uint8),
+                         predictions=np.fromiter((v for values in predictions for v in values), dtype=np.uint8),
+                         snr=np.repeat(np.asarray(snr, dtype=np.int64), counts),
+                         run=np.repeat(np.asarray(run, dtype=np.int64), counts),
+                         model=np.repeat(np.asarray(model, dtype=np.uint8), counts),
+                         label_names=label_names,
+                         sizes=sizes)
+
+
+@dataclass
+class ModelMetrics:
+    """
+    The metrics of one model type for every SNR and run.
+
+    snrs: The SNRs in ascending order. The first axis of every metric is in this order.
+    confusion_matrices: A (snrs, runs, labels, labels) array with the number of images of each
+                        true label (rows) that were predicted as each label (columns).
+    """
+    snrs: npt.NDArray[np.int64]
+    confusion_matrices: npt.NDArray[np.int64]
+
+    def get_snr_index(self, snr: int) -> int:
+        return int(np.flatnonzero(self.snrs == snr)[0])
+
+    @property
+    def correct(self) -> npt.NDArray[np.int64]:
+        """
+        A (snrs, runs) array with the number of correct predictions.
+        """
+        return np.trace(self.confusion_matrices, axis1=2, axis2=3)
+
+    @property
+    def total(self) -> npt.NDArray[np.int64]:
+        """
+        A (snrs, runs) array with the number of predictions.
+        """
+        return self.confusion_matrices.sum(axis=(2, 3))
+
+    @property
+    def run_accuracy(self) -> npt.NDArray[np.float64]:
+        """
+        A (snrs, runs) array with the accuracy of each run. Runs without results at an SNR are NaN.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.correct / self.total
+
+    @property
+    def accuracy(self) -> npt.NDArray[np.float64]:
+        """
+        The accuracy at each SNR of all the runs together. This is the same as calc_accuracy of the
+        get_all_*_labels and get_all_*_predictions of the result.
+        """
+        return self.correct.sum(axis=1) / self.total.sum(axis=1)
+
+    @property
+    def mean_accuracy(self) -> npt.NDArray[np.float64]:
+        """
+        The mean of the accuracy of the runs at each SNR.
+        """
+        return np.nanmean(self.run_accuracy, axis=1)
+
+    @property
+    def std_accuracy(self) -> npt.NDArray[np.float64]:
+        """
+        The standard deviation of the accuracy of the runs at each SNR.
+        """
+        return np.nanstd(self.run_accuracy, axis=1)
+
+    def confusion_matrix(self, snr: int, normalize: bool = False) -> npt.NDArray:
+        """
+        The confusion matrix of all the runs together at an SNR.
+
+        :param normalize: Divide each row by the number of images with that true label.
+        """
+        cm = self.confusion_matrices[self.get_snr_index(snr)].sum(axis=0)
+
+        if normalize:
+            return cm.astype(np.float32) / cm.sum(axis=1)[:, np.newaxis]
+
+        return cm
+
+    def run_confusion_matrices(self, snr: int, normalize: bool = False) -> npt.NDArray:
+        """
+        A (runs, labels, labels) array with the confusion matrix of each run at an SNR.
+        """
+        cms = self.confusion_matrices[self.get_snr_index(snr)]
+
+        if normalize:
+            return cms.astype(np.float64) / cms.sum(axis=2)[:, :, np.newaxis]
+
+        return cms
+
+    def bootstrap_accuracy_interval(self,
+                                    confidence: float = 0.95,
+                                    samples: int = 10000,
+                                    seed: int = 0) -> npt.NDArray[np.float64]:
+        """
+        Bootstrap confidence intervals of the accuracy of all the runs together at each SNR.
+
+        Resampling n predictions with replacement and counting the correct ones is the same as
+        drawing from a binomial distribution with the observed accuracy, so every SNR is
+        bootstrapped at once without resampling the predictions themselves.
+
+        :return: A (snrs, 2) array with the lower and upper bound of each interval.
+        """
+        rng = np.random.default_rng(seed)
+
+        total = self.total.sum(axis=1)
+        accuracies = rng.binomial(total, self.accuracy, size=(samples, len(self.snrs))) / total
+
+        alpha = (1 - confidence) / 2
+
+        return np.quantile(accuracies, [alpha, 1 - alpha], axis=0).T
+
+
+@dataclass
+class ResultsMetrics:
+    label_names: List[str]
+    full: ModelMetrics
+    lite: ModelMetrics
+    sizes: Dict[Tuple[int, int, str], int]
+
+
+def compute_metrics(columns: ResultColumns) -> ResultsMetrics:
+    """
+    Count the confusion matrices of every model type, SNR and run in one pass over the predictions.
+    """
+    label_count = len(columns.label_names)
+    (snrs, snr_index) = np.unique(columns.snr, return_inverse=True)
+    run_count = int(columns.run.max()) + 1 if len(columns.run) > 0 else 0
+    model_count = len(results_store.model_types)
+
+    # The index of the cell in a (models, snrs, runs, labels, labels) array for each prediction.
+    index = columns.model.astype(np.int64)
+    index = index * len(snrs) + snr_index.reshape(-1)
+    index = index * run_count + columns.run
+    index = index * label_count + columns.labels
+    index = index * label_count + columns.predictions
+
+    shape = (model_count, len(snrs), run_count, label_count, label_count)
+    confusion_matrices = np.bincount(index, minlength=int(np.prod(shape))).reshape(shape)
+
+    return ResultsMetrics(
+        label_names=columns.label_names,
+        full=ModelMetrics(snrs=snrs, confusion_matrices=confusion_matrices[results_store.model_types.index("full")]),
+        lite=ModelMetrics(snrs=snrs, confusion_matrices=confusion_matrices[results_store.model_types.index("lite")]),
+        sizes=columns.sizes
+    )
+
+
+_metrics_cache: Dict[Tuple[str, int], ResultsMetrics] = {}
+
+
+def load_metrics(file_name: str) -> ResultsMetrics:
+    """
+    Compute the metrics of a results file. The metrics are remembered until the file changes
+    so plotting the same results many times only reads them once.
+    """
+    store_dir = results_store.get_store_dir(file_name)
+
+    if results_store.read_meta(store_dir) is not None:
+        path = os.path.abspath(store_dir)
+        modified = os.stat(os.path.join(store_dir, "meta.json")).st_mtime_ns
+    else:
+        path = os.path.abspath(file_name)
+        modified = os.stat(file_name).st_mtime_ns
+
+    key = (path, modified)
+
+    if key not in _metrics_cache:
+        _metrics_cache[key] = compute_metrics(read_result_columns(file_name))
+
+    return _metrics_cache[key]
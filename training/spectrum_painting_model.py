@@ -1,11 +1,41 @@
-from typing import List
+import time
+from dataclasses import dataclass
+from typing import List, Optional
 
 import numpy as np
 import numpy.typing as npt
 import tensorflow as tf
 from tensorflow.keras import models, layers, losses, callbacks
 
-from spectrum_painting_training import SpectrumPaintingTrainTestSets
+import profiling
+from spectrum_painting_training import SpectrumPaintingTrainTestSets, SpectrumPaintingFeatures
+
+# The names of the inputs of the model in the order the images are passed to it. The inputs are
+# named so they can be found in the TensorFlow Lite model. Keras names unnamed inputs input_1,
+# input_2 and so on, and TensorFlow Lite sorts the names, so input_10 would come before input_9.
+input_names = ["augmented", "painted"]
+
+# The number of test images of every label and SNR to calibrate the quantization with by default.
+default_calibration_samples = 20
+
+
+@dataclass
+class FastTrainingOptions:
+    """
+    Options for training faster on the CPU.
+
+    jit_compile: Compile the training step with XLA.
+    mixed_precision: The Keras mixed precision policy, e.g mixed_bfloat16 or mixed_float16. None uses float32.
+    batch_size: The batch size to train with.
+    base_batch_size: The batch size that base_learning_rate is for. The learning rate is
+                     scaled by batch_size / base_batch_size.
+    base_learning_rate: The learning rate of the Adam optimizer for base_batch_size.
+    """
+    jit_compile: bool = True
+    mixed_precision: Optional[str] = "mixed_bfloat16"
+    batch_size: int = 512
+    base_batch_size: int = 128
+    base_learning_rate: float = 0.001
 
 
 def create_channel(input: layers.Input, filters: int) -> layers.Layer:
@@ -22,17 +52,56 @@ def create_channel(input: layers.Input, filters: int) -> layers.Layer:
     return layer
 
 
-def create_tensorflow_model(image_shape: (int, int), label_count: int, filters: int = 2) -> models.Model:
+def create_tensorflow_model(image_shape: (int, int),
+                            label_count: int,
+                            filters: int = 2,
+                            mixed_precision: Optional[str] = None) -> models.Model:
+    """
+    :param mixed_precision: The Keras mixed precision policy for the layers, e.g mixed_bfloat16.
+                            The output layer is always float32.
+    """
     tf.keras.backend.clear_session()
 
+    if mixed_precision is None:
+        return build_tensorflow_model(image_shape, label_count, filters)
+
+    tf.keras.mixed_precision.set_global_policy(mixed_precision)
+
+    try:
+        return build_tensorflow_model(image_shape, label_count, filters, output_dtype="float32")
+    finally:
+        # Only this model uses mixed precision.
+        tf.keras.mixed_precision.set_global_policy("float32")
+
+
+def create_float32_copy(model: models.Model, image_shape: (int, int), label_count: int, filters: int = 2) -> models.Model:
+    """
+    Copy the weights of a model trained with mixed precision into a float32 model so
+    it can be converted to TensorFlow Lite. The weights of a mixed precision model are
+    already stored as float32.
+    """
+    float32_model = build_tensorflow_model(image_shape, label_count, filters)
+    float32_model.set_weights(model.get_weights())
+
+    return float32_model
+
+
+def build_tensorflow_model(image_shape: (int, int),
+                           label_count: int,
+                           filters: int = 2,
+                           name: Optional[str] = None,
+                           output_dtype: Optional[str] = None) -> models.Model:
+    """
+    Build the model without clearing the Keras session so many models can be created at once.
+    """
     # The input shape to the CNN is the height, width and number of color channels. The spectrograms
     # only have one color channel.
     input_shape = (image_shape[0], image_shape[1], 1)
 
-    augmented_input = layers.Input(shape=input_shape)
+    augmented_input = layers.Input(shape=input_shape, name=input_names[0])
     augmented_channel = create_channel(augmented_input, filters)
 
-    painted_input = layers.Input(shape=input_shape)
+    painted_input = layers.Input(shape=input_shape, name=input_names[1])
     painted_channel = create_channel(painted_input, filters)
 
     output = layers.Concatenate()([augmented_channel, painted_channel])
@@ -40,13 +109,175 @@ def create_tensorflow_model(image_shape: (int, int), label_count: int, filters:
     # Flatten the 3D image output to 1 dimension
     output = layers.Flatten()(output)
 
-    output = layers.Dense(label_count)(output)
+    output = layers.Dense(label_count, dtype=output_dtype)(output)
 
-    tf_model = models.Model(inputs=[augmented_input, painted_input], outputs=[output])
+    tf_model = models.Model(inputs=[augmented_input, painted_input], outputs=[output], name=name)
 
     return tf_model
 
 
+def create_tensorflow_ensemble(image_shape: (int, int),
+                               label_count: int,
+                               filters: int = 2,
+                               replicas: int = 10) -> (models.Model, List[models.Model]):
+    """
+    Create one model that contains many independent copies of the model so they can be trained at
+    the same time. The copies share the inputs but each one has its own weights and output.
+
+    :return: The ensemble to train and the replicas. Each replica is a normal model that can be saved
+             and converted on its own after the ensemble is trained.
+    """
+    tf.keras.backend.clear_session()
+
+    replica_models = [build_tensorflow_model(image_shape, label_count, filters, name=f"replica_{i}")
+                      for i in range(replicas)]
+
+    input_shape = (image_shape[0], image_shape[1], 1)
+    augmented_input = layers.Input(shape=input_shape, name=input_names[0])
+    painted_input = layers.Input(shape=input_shape, name=input_names[1])
+
+    outputs = [replica([augmented_input, painted_input]) for replica in replica_models]
+
+    ensemble = models.Model(inputs=[augmented_input, painted_input], outputs=outputs)
+
+    return ensemble, replica_models
+
+
+class ReplicaEarlyStopping(callbacks.Callback):
+    """
+    Stop each replica of an ensemble like callbacks.EarlyStopping on the loss of that replica, so every
+    replica stops at the same epoch as it would if it was trained on its own with fit_model.
+
+    The replicas do not share any weights, so a replica that has stopped keeps being trained with the
+    others and its weights from the epoch it stopped at are restored when training ends. Training ends
+    when every replica has stopped.
+    """
+
+    def __init__(self,
+                 replicas: List[models.Model],
+                 loss_keys: List[str],
+                 loss_scales: List[float],
+                 patience: int,
+                 min_delta: float):
+        """
+        :param replicas: The replicas in the order of the outputs of the ensemble.
+        :param loss_keys: The key of the loss of each replica in the logs.
+        :param loss_scales: The fraction of the images that are training images of each replica.
+                            The losses are divided by it to get the loss of the replica's training images.
+        """
+        super().__init__()
+        self.replicas = replicas
+        self.loss_keys = loss_keys
+        self.loss_scales = loss_scales
+        self.patience = patience
+        self.min_delta = min_delta
+
+    def on_train_begin(self, logs=None):
+        self.best = [np.inf] * len(self.replicas)
+        self.wait = [0] * len(self.replicas)
+        # The epoch each replica stopped at and its weights at the end of that epoch.
+        self.stopped_epochs: List[Optional[int]] = [None] * len(self.replicas)
+        self.stopped_weights: List[Optional[List[npt.NDArray]]] = [None] * len(self.replicas)
+
+    def on_epoch_end(self, epoch, logs=None):
+        for (r, replica) in enumerate(self.replicas):
+            if self.stopped_epochs[r] is not None:
+                continue
+
+            loss = logs[self.loss_keys[r]] / self.loss_scales[r]
+            self.wait[r] += 1
+
+            if loss < self.best[r] - self.min_delta:
+                self.best[r] = loss
+                self.wait[r] = 0
+
+            if self.wait[r] >= self.patience and epoch > 0:
+                self.stopped_epochs[r] = epoch
+                self.stopped_weights[r] = replica.get_weights()
+
+        if all(stopped_epoch is not None for stopped_epoch in self.stopped_epochs):
+            self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        for (replica, weights) in zip(self.replicas, self.stopped_weights):
+            if weights is not None:
+                replica.set_weights(weights)
+
+
+@profiling.profiled()
+def fit_ensemble(ensemble: models.Model,
+                 features: SpectrumPaintingFeatures,
+                 train_indices: List[npt.NDArray[np.int64]],
+                 test_indices: List[npt.NDArray[np.int64]],
+                 epochs: int,
+                 early_stopping_patience: int,
+                 batch_size: int = 128):
+    """
+    Train every replica in an ensemble at the same time. Each replica has its own training and
+    test set. All the images are passed to every replica but the loss of each replica is weighted
+    so only its own training images count.
+
+    Each replica stops early on its own loss in the same way as fit_model, see ReplicaEarlyStopping.
+
+    :param train_indices: The indices of the training images for each replica.
+    :param test_indices: The indices of the test images for each replica.
+    :param batch_size: The average number of training images for each replica in a batch.
+    """
+    replicas = len(ensemble.outputs)
+    image_count = len(features.labels)
+
+    train_weights = np.zeros(shape=(replicas, image_count), dtype=np.float32)
+    test_weights = np.zeros(shape=(replicas, image_count), dtype=np.float32)
+
+    for r in range(replicas):
+        train_weights[r, train_indices[r]] = 1
+        test_weights[r, test_indices[r]] = 1
+
+    # Increase the batch size so each replica sees the same number of its own
+    # training images in each batch as when it is trained on its own.
+    train_fractions = list(np.mean(train_weights, axis=1))
+    train_fraction = np.mean(train_weights)
+    batch_size = int(round(batch_size / train_fraction))
+
+    ensemble.compile(optimizer='adam',
+                     loss=[losses.SparseCategoricalCrossentropy(from_logits=True)] * replicas,
+                     # Weight the accuracy so each replica is only scored on its own test images.
+                     weighted_metrics=[['accuracy'] for _ in range(replicas)])
+
+    x = [np.asarray(features.x_augmented), np.asarray(features.x_painted)]
+    y = [features.labels] * replicas
+    train_weights = list(train_weights)
+    test_weights = list(test_weights)
+
+    # Keras expects a model with one output to have one set of labels and weights rather than a list.
+    if replicas == 1:
+        (y, train_weights, test_weights) = (y[0], train_weights[0], test_weights[0])
+
+    class CustomCallback(callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            val_accuracy = np.mean([value for (key, value) in logs.items()
+                                    if key.startswith("val_") and key.endswith("accuracy")])
+            print("\r", f"Epoch: {epoch}, Mean val. accuracy = {val_accuracy}", end="")
+
+    # Keras only logs the loss of each output separately when there is more than one.
+    loss_keys = [f"{name}_loss" for name in ensemble.output_names] if replicas > 1 else ["loss"]
+
+    early_stopping_callback = ReplicaEarlyStopping(replicas=[ensemble.get_layer(name) for name in ensemble.output_names],
+                                                   loss_keys=loss_keys,
+                                                   loss_scales=train_fractions,
+                                                   patience=early_stopping_patience,
+                                                   min_delta=0.02)
+
+    return ensemble.fit(x=x,
+                        y=y,
+                        sample_weight=train_weights,
+                        epochs=epochs,
+                        validation_data=(x, y, test_weights),
+                        verbose=0,
+                        batch_size=batch_size,
+                        callbacks=[CustomCallback(), early_stopping_callback])
+
+
 def create_tensorflow_model_one_channel(image_shape: (int, int), label_count: int) -> models.Model:
     # The input shape to the CNN is the height, width and number of color channels. The spectrograms
     # only have one color channel.
@@ -65,14 +296,69 @@ def create_tensorflow_model_one_channel(image_shape: (int, int), label_count: in
     return tf_model
 
 
-def fit_model(model: models.Model,
-              train_test_sets: SpectrumPaintingTrainTestSets,
-              epochs: int,
-              early_stopping_patience: int):
-    model.compile(optimizer='adam',
-                  loss=losses.SparseCategoricalCrossentropy(from_logits=True),
-                  metrics=['accuracy'])
+def create_dataset(x_augmented: npt.NDArray[np.uint8],
+                   x_painted: npt.NDArray[np.uint8],
+                   y: npt.NDArray[np.uint8],
+                   batch_size: int = 128,
+                   shuffle: bool = False,
+                   shuffle_buffer_size: int = 10000,
+                   seed: Optional[int] = None,
+                   indices: Optional[npt.NDArray[np.int64]] = None) -> tf.data.Dataset:
+    """
+    Create a tf.data pipeline that feeds the uint8 images to the model. The images are
+    converted to float32 and given a color channel inside the graph and the next batches
+    are prefetched while the model is training.
+
+    If the images are memory-mapped or indices are given then only the indices are put in the
+    dataset and each batch of images is read from the arrays when it is needed. This means
+    datasets that are bigger than the memory can be used.
+
+    :param indices: The indices of the images in the arrays to use. Defaults to all of them.
+    """
+
+    def to_model_input(augmented, painted, labels):
+        augmented = tf.cast(augmented[..., tf.newaxis], tf.float32)
+        painted = tf.cast(painted[..., tf.newaxis], tf.float32)
+        return (augmented, painted), labels
+
+    if indices is None and not isinstance(x_augmented, np.memmap):
+        dataset = tf.data.Dataset.from_tensor_slices((x_augmented, x_painted, y))
+
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer_size, seed=seed, reshuffle_each_iteration=True)
+
+        dataset = dataset.batch(batch_size)
+    else:
+        if indices is None:
+            indices = np.arange(len(y))
 
+        image_shape = x_augmented.shape[1:]
+
+        def read_batch(batch_indices):
+            # Reading the images in order is faster for memory-mapped arrays.
+            batch_indices = np.sort(batch_indices)
+            return x_augmented[batch_indices], x_painted[batch_indices], y[batch_indices]
+
+        def read_batch_tensor(batch_indices):
+            (augmented, painted, labels) = tf.numpy_function(read_batch,
+                                                             [batch_indices],
+                                                             [tf.uint8, tf.uint8, tf.uint8])
+            augmented.set_shape((None,) + image_shape)
+            painted.set_shape((None,) + image_shape)
+            labels.set_shape((None,))
+            return augmented, painted, labels
+
+        dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer_size, seed=seed, reshuffle_each_iteration=True)
+
+        dataset = dataset.batch(batch_size).map(read_batch_tensor, num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.map(to_model_input, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def create_fit_callbacks(early_stopping_patience: int) -> List[callbacks.Callback]:
     class CustomCallback(callbacks.Callback):
         def on_epoch_end(self, epoch, logs=None):
             # print the epoch and accuracy on the same line. The carriage return and empty end character
@@ -80,7 +366,77 @@ def fit_model(model: models.Model,
             print("\r", f"Epoch: {epoch}, Val. accuracy = {logs.get('val_accuracy')}", end="")
 
     early_stopping_callback = callbacks.EarlyStopping(monitor='loss', patience=early_stopping_patience,
-                                                            min_delta=0.02)
+                                                      min_delta=0.02)
+
+    return [EpochTimeCallback(), CustomCallback(), early_stopping_callback]
+
+
+class EpochTimeCallback(callbacks.Callback):
+    """
+    Add the wall time of each epoch in seconds to the history as epoch_time.
+    """
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs["epoch_time"] = time.perf_counter() - self.epoch_start
+
+
+@profiling.profiled()
+def fit_model(model: models.Model,
+              train_test_sets: SpectrumPaintingTrainTestSets,
+              epochs: int,
+              early_stopping_patience: int,
+              use_dataset: bool = False,
+              shuffle_buffer_size: int = 10000,
+              seed: Optional[int] = None,
+              fast_options: Optional[FastTrainingOptions] = None):
+    """
+    :param use_dataset: Feed the images to the model with a tf.data pipeline instead of passing the arrays to Keras.
+    :param shuffle_buffer_size: The size of the shuffle buffer in the tf.data pipeline.
+    :param seed: The seed for shuffling in the tf.data pipeline.
+    :param fast_options: Train with XLA and a larger batch size. Create the model with the same
+                         mixed_precision policy for mixed precision training.
+    :return: The history. history.history["epoch_time"] is the wall time of each epoch.
+    """
+    # use higher batch size to increase training speed since we have thousands of training images
+    batch_size = 128
+
+    if fast_options is None:
+        model.compile(optimizer='adam',
+                      loss=losses.SparseCategoricalCrossentropy(from_logits=True),
+                      metrics=['accuracy'])
+    else:
+        batch_size = fast_options.batch_size
+        learning_rate = fast_options.base_learning_rate * (fast_options.batch_size / fast_options.base_batch_size)
+
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                      loss=losses.SparseCategoricalCrossentropy(from_logits=True),
+                      metrics=['accuracy'],
+                      jit_compile=fast_options.jit_compile)
+
+    if use_dataset:
+        train_dataset = create_dataset(train_test_sets.x_train_augmented,
+                                       train_test_sets.x_train_painted,
+                                       train_test_sets.y_train,
+                                       batch_size=batch_size,
+                                       shuffle=True,
+                                       shuffle_buffer_size=shuffle_buffer_size,
+                                       seed=seed)
+
+        test_dataset = create_dataset(train_test_sets.x_test_augmented,
+                                      train_test_sets.x_test_painted,
+                                      train_test_sets.y_test,
+                                      batch_size=batch_size)
+
+        return model.fit(train_dataset,
+                         epochs=epochs,
+                         validation_data=test_dataset,
+                         verbose=0,
+                         callbacks=create_fit_callbacks(early_stopping_patience))
+
     # convert ints to the type of int that can be used in a Tensor
     history = model.fit(x=[train_test_sets.x_train_augmented, train_test_sets.x_train_painted],
                         y=train_test_sets.y_train,
@@ -89,13 +445,56 @@ def fit_model(model: models.Model,
                             [train_test_sets.x_test_augmented, train_test_sets.x_test_painted],
                             train_test_sets.y_test),
                         verbose=0,
-                        batch_size=128,
-                        # use higher batch size to increase training speed since we have thousands of training images
-                        callbacks=[CustomCallback(), early_stopping_callback], )
+                        batch_size=batch_size,
+                        callbacks=create_fit_callbacks(early_stopping_patience), )
 
     return history
 
 
+@profiling.profiled()
+def fit_model_on_features(model: models.Model,
+                          features: SpectrumPaintingFeatures,
+                          train_indices: npt.NDArray[np.int64],
+                          test_indices: npt.NDArray[np.int64],
+                          epochs: int,
+                          early_stopping_patience: int,
+                          batch_size: int = 128,
+                          shuffle_buffer_size: int = 10000,
+                          seed: Optional[int] = None):
+    """
+    Train the model by streaming the images from the features, e.g features loaded with
+    load_spectrum_painting_features. The training and test sets are never copied into memory.
+
+    :param train_indices: The indices of the training images, e.g from split_feature_indices.
+    :param test_indices: The indices of the test images.
+    """
+    model.compile(optimizer='adam',
+                  loss=losses.SparseCategoricalCrossentropy(from_logits=True),
+                  metrics=['accuracy'])
+
+    train_dataset = create_dataset(features.x_augmented,
+                                   features.x_painted,
+                                   features.labels,
+                                   batch_size=batch_size,
+                                   shuffle=True,
+                                   shuffle_buffer_size=shuffle_buffer_size,
+                                   seed=seed,
+                                   indices=train_indices)
+
+    test_dataset = create_dataset(features.x_augmented,
+                                  features.x_painted,
+                                  features.labels,
+                                  batch_size=batch_size,
+                                  indices=test_indices)
+
+    return model.fit(train_dataset,
+                     epochs=epochs,
+                     validation_data=test_dataset,
+                     verbose=0,
+                     callbacks=create_fit_callbacks(early_stopping_patience))
+
+
+@profiling.profiled()
 def fit_model_one_channel(model: models.Model,
                           train_test_sets: SpectrumPaintingTrainTestSets,
                           epochs: int,
@@ -124,36 +523,118 @@ def fit_model_one_channel(model: models.Model,
     return history
 
 
-def convert_to_tensorflow_lite(model: models.Model,
-                               augmented_test_images: List[npt.NDArray[np.uint8]],
-                               painted_test_images: List[npt.NDArray[np.uint8]]):
+def select_calibration_indices(labels: npt.NDArray[np.uint8],
+                               snrs: npt.NDArray[np.int64],
+                               samples_per_group: int,
+                               seed: int = 0) -> npt.NDArray[np.int64]:
     """
-    Convert the full tensorflow model to a Lite model.
+    Pick the images to calibrate the quantization with. The same number of images is
+    picked at random from every label and SNR so every class and noise level is represented.
+
+    :param labels: The label of each image.
+    :param snrs: The SNR of each image.
+    :param samples_per_group: The number of images to pick for each label and SNR. Groups with
+                              fewer images use all of them.
+    :param seed: The seed for picking the images.
+    :return: The sorted indices of the picked images.
+    """
+    labels = np.asarray(labels)
+    snrs = np.asarray(snrs)
+
+    rng = np.random.default_rng(seed)
+    indices = []
+
+    # Sort by label and then SNR so the images of each group are next to each other.
+    order = np.lexsort((snrs, labels))
+    sorted_labels = labels[order]
+    sorted_snrs = snrs[order]
+
+    is_group_start = np.ones(len(order), dtype=bool)
+    is_group_start[1:] = (sorted_labels[1:] != sorted_labels[:-1]) | (sorted_snrs[1:] != sorted_snrs[:-1])
+    group_starts = np.flatnonzero(is_group_start)
+    group_ends = np.append(group_starts[1:], len(order))
+
+    for (group_start, group_end) in zip(group_starts, group_ends):
+        group = order[group_start:group_end]
+
+        if len(group) > samples_per_group:
+            group = rng.choice(group, size=samples_per_group, replace=False)
+
+        indices.append(group)
+
+    if len(indices) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    return np.sort(np.concatenate(indices)).astype(np.int64)
+
+
+def get_calibration_indices(labels: Optional[npt.NDArray[np.uint8]],
+                            snrs: Optional[List[int]],
+                            calibration_samples: Optional[int],
+                            seed: int = 0) -> Optional[npt.NDArray[np.int64]]:
+    """
+    The indices of the images to calibrate with, or None to calibrate with every image.
+
+    :param calibration_samples: The number of images of every label and SNR, or None for every image.
+    :raises ValueError: If calibration_samples is given without labels and snrs.
+    """
+    if calibration_samples is None:
+        return None
+
+    if labels is None or snrs is None:
+        raise ValueError("labels and snrs are required to pick the calibration images. "
+                         "Pass calibration_samples=None to calibrate with every image.")
+
+    return select_calibration_indices(labels, snrs, calibration_samples, seed)
+
+
+def create_representative_dataset(augmented_images: List[npt.NDArray[np.uint8]],
+                                  painted_images: List[npt.NDArray[np.uint8]],
+                                  indices: Optional[npt.NDArray[np.int64]] = None):
     """
+    Create a generator for the representative dataset that yields one image at a time
+    as a float32 batch of size one. Only the image being yielded is converted so the
+    whole set is never copied.
+
+    :param indices: The images to yield. Defaults to all of them.
+    """
+    if indices is None:
+        indices = range(len(augmented_images))
 
     def representative_data_gen():
-        """
-        Convert test images to float32 and the correct dimensions
-        for TensorFlow to do full-integer quantization.
-        """
-        repr_augmented_images = np.copy(augmented_test_images)
-        repr_augmented_images = [img.astype(np.float32) for img in repr_augmented_images]
+        for i in indices:
+            # Add the batch and channel dimensions.
+            augmented = np.asarray(augmented_images[i], dtype=np.float32)[np.newaxis, ..., np.newaxis]
+            painted = np.asarray(painted_images[i], dtype=np.float32)[np.newaxis, ..., np.newaxis]
 
-        for img in repr_augmented_images:
-            img.shape += (1,)
+            yield [augmented, painted]
 
-        repr_painted_images = np.copy(painted_test_images)
-        repr_painted_images = [img.astype(np.float32) for img in repr_painted_images]
+    return representative_data_gen
 
-        for img in repr_painted_images:
-            img.shape += (1,)
 
-        repr_augmented_images = np.expand_dims(repr_augmented_images, 0)
-        repr_painted_images = np.expand_dims(repr_painted_images, 0)
+@profiling.profiled()
+def convert_to_tensorflow_lite(model: models.Model,
+                               augmented_test_images: List[npt.NDArray[np.uint8]],
+                               painted_test_images: List[npt.NDArray[np.uint8]],
+                               labels: Optional[npt.NDArray[np.uint8]] = None,
+                               snrs: Optional[List[int]] = None,
+                               calibration_samples: Optional[int] = default_calibration_samples,
+                               seed: int = 0):
+    """
+    Convert the full tensorflow model to a Lite model.
+
+    The quantization is calibrated with default_calibration_samples images of every label and SNR,
+    so labels and snrs must be given. Models used to be calibrated with every test image, which is
+    much slower and now needs calibration_samples=None.
 
-        for aug_value, painted_value in list(zip(repr_augmented_images, repr_painted_images)):
-            # Model has only one input so each data point has one element.
-            yield [aug_value, painted_value]
+    :param labels: The label of each test image. Required with calibration_samples.
+    :param snrs: The SNR of each test image. Required with calibration_samples.
+    :param calibration_samples: Calibrate the quantization with this many images of every label and SNR,
+                                or with every test image if it is None.
+    :param seed: The seed for picking the calibration images.
+    """
+    indices = get_calibration_indices(labels, snrs, calibration_samples, seed)
+    representative_data_gen = create_representative_dataset(augmented_test_images, painted_test_images, indices)
 
     # This requires TensorFlow <= 2.15.0 for it to work. See https://github.com/tensorflow/tensorflow/issues/63987
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
@@ -167,6 +648,7 @@ def convert_to_tensorflow_lite(model: models.Model,
     return converter.convert()
 
 
+@profiling.profiled()
 def convert_to_tensorflow_lite_no_quantization(model: models.Model):
     """
     Convert the full tensorflow model to a Lite model.
@@ -178,6 +660,7 @@ def convert_to_tensorflow_lite_no_quantization(model: models.Model):
     return converter.convert()
 
 
+@profiling.profiled()
 def convert_to_tensorflow_lite_one_channel(model: models.Model,
                                            test_images: List[npt.NDArray[np.uint8]]):
     """
@@ -1,11 +1,18 @@
-from typing import List
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
 
 import numpy as np
 import numpy.typing as npt
 import tensorflow as tf
 from tensorflow.keras import models
 
+import profiling
+import spectrum_painting_model as sp_model
 
+
+@profiling.profiled()
 def predict_full_model(model: models.Model,
                        x_augmented: npt.NDArray[np.uint8],
                        x_painted: npt.NDArray[np.uint8]) -> int:
@@ -23,6 +30,59 @@ def predict_full_model(model: models.Model,
     return int(prediction_index)
 
 
+def create_full_model_predict_function(model: models.Model):
+    """
+    Create a compiled function that takes a batch of uint8 augmented and painted images
+    and returns the index of the predicted label for each image.
+    """
+    image_shape = model.inputs[0].shape[1:3]
+    input_signature = [tf.TensorSpec(shape=(None,) + tuple(image_shape), dtype=tf.uint8),
+                       tf.TensorSpec(shape=(None,) + tuple(image_shape), dtype=tf.uint8)]
+
+    @tf.function(input_signature=input_signature)
+    def predict(x_augmented, x_painted):
+        # Add the color channel and convert to float inside the graph.
+        x_augmented = tf.cast(x_augmented[..., tf.newaxis], tf.float32)
+        x_painted = tf.cast(x_painted[..., tf.newaxis], tf.float32)
+
+        logits = model([x_augmented, x_painted], training=False)
+        return tf.argmax(logits, axis=1)
+
+    return predict
+
+
+@profiling.profiled()
+def predict_full_model_batch(model: models.Model,
+                             x_augmented: npt.NDArray[np.uint8],
+                             x_painted: npt.NDArray[np.uint8],
+                             batch_size: int = 1024,
+                             predict_function=None) -> npt.NDArray[np.int64]:
+    """
+    Predict the labels of many images at once.
+
+    :param x_augmented: A (N, height, width) array of augmented images.
+    :param x_painted: A (N, height, width) array of painted images.
+    :param batch_size: The number of images to pass to the model at once.
+    :param predict_function: A function created by create_full_model_predict_function. Pass this
+                             when predicting many times with the same model so it is only traced once.
+    :return: The index of the predicted label for each image.
+    """
+    if predict_function is None:
+        predict_function = create_full_model_predict_function(model)
+
+    profiling.count("full model images", len(x_augmented))
+
+    predictions = np.empty(shape=len(x_augmented), dtype=np.int64)
+
+    for start in range(0, len(x_augmented), batch_size):
+        end = start + batch_size
+        predictions[start:end] = predict_function(np.asarray(x_augmented[start:end], dtype=np.uint8),
+                                                  np.asarray(x_painted[start:end], dtype=np.uint8)).numpy()
+
+    return predictions
+
+
+@profiling.profiled()
 def predict_full_model_one_channel(model: models.Model, x_test: npt.NDArray[np.uint8]) -> int:
     x_test_copy = np.copy(x_test)
 
@@ -34,14 +94,27 @@ def predict_full_model_one_channel(model: models.Model, x_test: npt.NDArray[np.u
     return prediction_index
 
 
-def predict_lite_model(model: List[bytes],
+@profiling.profiled()
+def predict_lite_model(model: bytes,
                        x_augmented: npt.NDArray[np.uint8],
                        x_painted: npt.NDArray[np.uint8]) -> int:
-    x_augmented = np.copy(x_augmented)
-    x_painted = np.copy(x_painted)
+    # The inputs are found by name because their indices depend on the order TensorFlow Lite stores them in.
+    return LiteModelRunner(model).predict(x_augmented, x_painted)
+
+
+@profiling.profiled()
+def predict_lite_no_quant_model(model: bytes,
+                                x_augmented: npt.NDArray,
+                                x_painted: npt.NDArray) -> int:
+    # The images are converted to float32 when they are copied to the input tensors.
+    return LiteModelRunner(model).predict(x_augmented, x_painted)
+
 
-    x_augmented.shape += (1,)
-    x_painted.shape += (1,)
+@profiling.profiled()
+def predict_lite_model_one_channel(model: List[bytes], test_image: npt.NDArray[np.uint8]) -> int:
+    test_image.shape += (1,)
+    test_image = (np.expand_dims(test_image, 0))
+    test_image = test_image.astype(np.uint8)
 
     interpreter = tf.lite.Interpreter(model_content=model)
     interpreter.allocate_tensors()
@@ -49,56 +122,202 @@ def predict_lite_model(model: List[bytes],
     input_details = interpreter.get_input_details()[0]
     output_details = interpreter.get_output_details()[0]
 
-    interpreter.set_tensor(0, [x_augmented])
-    interpreter.set_tensor(1, [x_painted])
+    interpreter.set_tensor(0, test_image)
 
     interpreter.invoke()
 
     prediction = interpreter.get_tensor(output_details["index"])[0]
     prediction_index = np.argmax(prediction)
-    return int(prediction_index)
+    return prediction_index
 
 
-def predict_lite_no_quant_model(model: List[bytes],
-                                x_augmented: npt.NDArray,
-                                x_painted: npt.NDArray) -> int:
-    x_augmented = np.copy(x_augmented).astype(np.float32)
-    x_painted = np.copy(x_painted).astype(np.float32)
+class LiteModelRunner:
+    """
+    Runs a TensorFlow Lite model many times without creating a new interpreter for every prediction.
+
+    The flatbuffer is loaded once and each thread that uses the runner gets its own interpreter
+    with its tensors already allocated. The input and output tensors are found by their names
+    in the model's signature rather than assuming their indices.
+    """
 
-    x_augmented.shape += (1,)
-    x_painted.shape += (1,)
+    def __init__(self,
+                 model: bytes,
+                 input_names: Optional[Sequence[str]] = None,
+                 output_name: Optional[str] = None,
+                 num_threads: Optional[int] = None):
+        """
+        :param model: The contents of the .tflite file.
+        :param input_names: The names of the inputs in the order the images are passed to predict.
+                            Defaults to the order of get_input_names.
+        :param output_name: The name of the output. Defaults to the first output in the signature.
+        :param num_threads: The number of threads each interpreter uses.
+        """
+        self.model = model
+        self.num_threads = num_threads
+        self._local = threading.local()
+
+        interpreter = tf.lite.Interpreter(model_content=model)
+        (signature_key, signature_details) = next(iter(interpreter.get_signature_list().items()))
+        signature_inputs = interpreter.get_signature_runner(signature_key).get_input_details()
 
-    interpreter = tf.lite.Interpreter(model_content=model)
-    interpreter.allocate_tensors()
+        self.signature_key: str = signature_key
+        self.input_names: List[str] = list(input_names) if input_names is not None else get_input_names(
+            {name: details["index"] for (name, details) in signature_inputs.items()})
+        self.output_name: str = output_name if output_name is not None else signature_details["outputs"][0]
 
-    input_details = interpreter.get_input_details()[0]
-    output_details = interpreter.get_output_details()[0]
+    def _get_interpreter(self) -> tf.lite.Interpreter:
+        """
+        Get the interpreter for the current thread and create it if it does not exist.
+        """
+        interpreter = getattr(self._local, "interpreter", None)
 
-    interpreter.set_tensor(0, [x_augmented])
-    interpreter.set_tensor(1, [x_painted])
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_content=self.model, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
 
-    interpreter.invoke()
+            self._local.interpreter = interpreter
+            self._local.batch_size = 1
+            self._resolve_tensor_indices()
 
-    prediction = interpreter.get_tensor(output_details["index"])[0]
-    prediction_index = np.argmax(prediction)
-    return int(prediction_index)
+        return interpreter
 
+    def _resolve_tensor_indices(self):
+        signature_runner = self._local.interpreter.get_signature_runner(self.signature_key)
+        input_details = signature_runner.get_input_details()
+        output_details = signature_runner.get_output_details()
+
+        self._local.input_indices = [input_details[name]["index"] for name in self.input_names]
+        self._local.output_index = output_details[self.output_name]["index"]
 
-def predict_lite_model_one_channel(model: List[bytes], test_image: npt.NDArray[np.uint8]) -> int:
-    test_image.shape += (1,)
-    test_image = (np.expand_dims(test_image, 0))
-    test_image = test_image.astype(np.uint8)
+    def _resize(self, interpreter: tf.lite.Interpreter, batch_size: int):
+        if self._local.batch_size == batch_size:
+            return
 
-    interpreter = tf.lite.Interpreter(model_content=model)
-    interpreter.allocate_tensors()
+        for index in self._local.input_indices:
+            shape = list(interpreter.tensor(index)().shape)
+            shape[0] = batch_size
+            interpreter.resize_tensor_input(index, shape)
 
-    input_details = interpreter.get_input_details()[0]
-    output_details = interpreter.get_output_details()[0]
+        interpreter.allocate_tensors()
+        self._local.batch_size = batch_size
+
+    def predict(self, *images: npt.NDArray) -> int:
+        """
+        Predict the label of one image.
+
+        :param images: One (height, width) image for each input of the model, e.g the augmented and painted images.
+        :return: The index of the predicted label.
+        """
+        return int(self.predict_batch(*[np.expand_dims(img, 0) for img in images])[0])
+
+    @profiling.profiled()
+    def predict_batch(self, *images: npt.NDArray) -> npt.NDArray[np.int64]:
+        """
+        Predict the labels of a batch of images with one call to the interpreter.
+
+        :param images: One (N, height, width) array for each input of the model.
+        :return: The index of the predicted label for each image.
+        """
+        interpreter = self._get_interpreter()
+        self._resize(interpreter, len(images[0]))
+
+        profiling.count("lite model images", len(images[0]))
+
+        for (index, x) in zip(self._local.input_indices, images):
+            # Write straight into the input tensor's buffer. The view must not
+            # be kept when invoking the interpreter.
+            interpreter.tensor(index)()[..., 0] = x
+
+        interpreter.invoke()
+
+        return np.argmax(interpreter.tensor(self._local.output_index)(), axis=1)
+
+
+# The names Keras gives unnamed inputs, e.g input_1 and input_2, or input_layer and input_layer_1.
+_keras_input_name = re.compile(r"(input(?:_layer)?)(?:_(\d+))?")
+
+
+def get_input_names(input_indices: Dict[str, int]) -> List[str]:
+    """
+    The order to pass the images to a model in. The signature lists the inputs sorted by name, which
+    is not the order of the model's inputs, so the inputs are ordered by:
+    - sp_model.input_names for the models of sp_model.build_tensorflow_model.
+    - The number Keras adds to unnamed inputs for models built before the inputs were named,
+      so input_9 comes before input_10.
+    - The tensor index of each input, which is the order predict_lite_model used to set them in.
+
+    :param input_indices: Maps the name of each input in the signature to its tensor index.
+    :raises ValueError: If the inputs can not be ordered.
+    """
+    names = list(input_indices)
 
-    interpreter.set_tensor(0, test_image)
+    if len(names) == 1:
+        return names
 
-    interpreter.invoke()
+    if sorted(names) == sorted(sp_model.input_names):
+        return list(sp_model.input_names)
 
-    prediction = interpreter.get_tensor(output_details["index"])[0]
-    prediction_index = np.argmax(prediction)
-    return prediction_index
+    matches = [_keras_input_name.fullmatch(name) for name in names]
+
+    if all(match is not None for match in matches) and len({match.group(1) for match in matches}) == 1:
+        numbers = {name: int(match.group(2) or 0) for (name, match) in zip(names, matches)}
+
+        if len(set(numbers.values())) == len(names):
+            return sorted(names, key=lambda name: numbers[name])
+
+    if len(set(input_indices.values())) == len(names):
+        return sorted(names, key=lambda name: input_indices[name])
+
+    raise ValueError(f"Can not tell which image to pass to each of the inputs {names}. Pass input_names.")
+
+
+def check_lite_model_inputs(model: models.Model,
+                            runner: LiteModelRunner,
+                            x_augmented: npt.NDArray[np.uint8],
+                            x_painted: npt.NDArray[np.uint8],
+                            count: int = 16):
+    """
+    Check that a TensorFlow Lite model predicts the same labels as the Keras model for the first
+    count images, e.g to catch the augmented and painted images being passed to the wrong inputs.
+    Use the model without quantization because quantization can change a few of the predictions.
+
+    :raises ValueError: If any of the predictions are different.
+    """
+    full_predictions = np.asarray([predict_full_model(model, x_augmented[i], x_painted[i])
+                                   for i in range(min(count, len(x_augmented)))])
+    lite_predictions = runner.predict_batch(x_augmented[:len(full_predictions)], x_painted[:len(full_predictions)])
+
+    different = np.count_nonzero(full_predictions != lite_predictions)
+
+    if different > 0:
+        raise ValueError(f"The TensorFlow Lite model predicted {different} of {len(full_predictions)} images "
+                         f"differently to the Keras model. Check the inputs {runner.input_names} are in the right order.")
+
+
+@profiling.profiled()
+def predict_lite_model_parallel(runner: LiteModelRunner,
+                                x_augmented: npt.NDArray[np.uint8],
+                                x_painted: npt.NDArray[np.uint8],
+                                workers: Optional[int] = None,
+                                chunk_size: int = 64) -> npt.NDArray[np.int64]:
+    """
+    Predict the labels of many images with a pool of threads. Each thread has its own
+    interpreter from the runner and the interpreter releases the GIL while it is invoked
+    so the chunks are evaluated in parallel.
+
+    :param runner: Create this with num_threads=1 so the threads do not compete for the cores.
+    :param workers: The number of threads. Defaults to the number of CPUs.
+    :param chunk_size: The number of images in each call to predict_batch.
+    :return: The index of the predicted label for each image.
+    """
+    predictions = np.empty(shape=len(x_augmented), dtype=np.int64)
+
+    def predict_chunk(start: int):
+        end = start + chunk_size
+        predictions[start:end] = runner.predict_batch(x_augmented[start:end], x_painted[start:end])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so exceptions in the threads are raised.
+        list(executor.map(predict_chunk, range(0, len(x_augmented), chunk_size)))
+
+    return predictions
@@ -1,17 +1,21 @@
-import json
 import os
+import shutil
 import sys
+from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Optional
 
 import numpy as np
 import tensorflow as tf
 
-import spectrum_painting_data as sp_data
+import lite_model_cache
+import profiling
+import spectrogram_cache
 import spectrum_painting_model as sp_model
 import spectrum_painting_predict as sp_predict
+import spectrum_painting_results_store as results_store
 import spectrum_painting_training as sp_training
-from spectrum_painting_result import SpectrumPaintingResult, ModelResult
+from spectrum_painting_result import ModelResult
 
 gpus = tf.config.list_physical_devices('GPU')
 print("Num GPUs Available: ", len(gpus))
@@ -24,128 +28,261 @@ def calc_accuracy(y_test, predictions) -> float:
     return np.mean(np.asarray(y_test) == np.asarray(predictions))
 
 
-run_name_arg: Optional[str] = None
-filters: int = 2
-spectrogram_count: int = -1
+classes = ["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"]
+snr_list = [0, 5, 10, 15, 20, 25, 30]
 
-number_samples = 65536
-num_windows: int = 256
+# The number of test images of every label and SNR to calibrate the quantization with.
+calibration_samples = sp_model.default_calibration_samples
+
+
+def run_repeated_runs(run_name_arg: Optional[str],
+                      filters: int = 2,
+                      spectrogram_count: int = -1,
+                      num_windows: int = 256,
+                      spectrum_painting_options: Optional[sp_training.SpectrumPaintingTrainingOptions] = None,
+                      training_count: int = 10,
+                      lite_evaluation_workers: Optional[int] = None,
+                      features: Optional[sp_training.SpectrumPaintingFeatures] = None,
+                      concurrent_training: bool = False,
+                      fast_training: Optional[sp_model.FastTrainingOptions] = None):
+    """
+    Train training_count models on different splits of the data and test each one at every SNR.
+    The results of each iteration are appended to the results store in output/results-{run_name}
+    when the iteration finishes. If the store already has results then only the remaining
+    iterations are run, so an interrupted run can be continued by running it again. The parameters
+    of the run are stored with the results, and a run with different parameters raises a ValueError.
+
+    :param run_name_arg: The name of the run. If this is None then the current time is used.
+    :param lite_evaluation_workers: The number of threads to evaluate the TensorFlow Lite model with.
+                                    Defaults to the number of CPUs.
+    :param features: The augmented and painted images to use instead of creating them from the data.
+    :param concurrent_training: Train all the models at the same time in one ensemble. The models
+                                are saved as output/spectrum-painting-model-{run_name}-replica-{i}.
+    :param fast_training: Train each model with XLA, mixed precision and a larger batch size.
+                          This can not be used with concurrent_training.
+
+    Set SPECTRUM_PAINTING_PROFILE=1 to time each step of the run. The times of the run are written
+    to output/results-{run_name}-profile.json and output/results-{run_name}-trace.json after each iteration.
+    """
+    if concurrent_training and fast_training is not None:
+        raise ValueError("fast_training can not be used with concurrent_training because the ensemble "
+                         "is trained without XLA or mixed precision")
+
+    number_samples = 65536
+    window_length: int = number_samples // num_windows
+
+    if spectrum_painting_options is None:
+        spectrum_painting_options = sp_training.SpectrumPaintingTrainingOptions(
+            downsample_resolution=64,
+            k=3,
+            l=16,
+            d=4
+        )
 
-if len(sys.argv) > 1:
-    run_name_arg = sys.argv[1]
+    print(f"This run is called '{run_name_arg}'")
+    print(f"Using {filters} filters")
+    print(f"Creating {spectrogram_count} spectrograms for each SNR and class")
+    print(f"Using {num_windows} windows and {window_length} window length")
 
-if len(sys.argv) > 2:
-    filters = int(sys.argv[2])
+    run_name: str
 
-if len(sys.argv) > 3:
-    spectrogram_count = int(sys.argv[3])
+    if run_name_arg is None:
+        run_name = datetime.now().strftime("%Y%m%d-%H%M%S")
+    else:
+        run_name = run_name_arg
 
-if len(sys.argv) > 4:
-    num_windows = int(sys.argv[4])
+    # Only profile this run.
+    profiling.reset()
 
-window_length: int = number_samples // num_windows
+    if features is None:
+        features = create_features(spectrogram_count, num_windows, spectrum_painting_options)
 
-print(f"This run is called '{run_name_arg}'")
-print(f"Using {filters} filters")
-print(f"Creating {spectrogram_count} spectrograms for each SNR and class")
-print(f"Using {num_windows} windows and {window_length} window length")
+    # The results of a run can only be continued with the same parameters.
+    run_parameters = {
+        "filters": filters,
+        "spectrogram_count": spectrogram_count,
+        "num_windows": num_windows,
+        "window_length": window_length,
+        "spectrum_painting_options": asdict(spectrum_painting_options),
+        "snr_list": [int(snr) for snr in np.unique(features.snr)]
+    }
 
-classes = ["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"]
-snr_list = [0, 5, 10, 15, 20, 25, 30]
+    results_prefix = f"output/results-{run_name}"
+    writer = results_store.ResultsStoreWriter(results_prefix, features.label_names, run_parameters)
+    first_iteration = writer.next_run
 
-spectrum_painting_options = sp_training.SpectrumPaintingTrainingOptions(
-    downsample_resolution=64,
-    k=3,
-    l=16,
-    d=4
-)
-
-training_count = 10
-
-results: Dict[int, SpectrumPaintingResult] = {}
-
-for snr in snr_list:
-    results[snr] = SpectrumPaintingResult(
-        snr=snr,
-        full_model_results=[],
-        lite_model_results=[],
-        label_names=[]
-    )
-
-print("Loading spectrograms")
-# Create the spectrograms once.
-spectrograms = sp_data.load_spectrograms(data_dir="data/numpy",
-                                         classes=classes,
-                                         snr_list=snr_list,
-                                         windows_per_spectrogram=num_windows,
-                                         window_length=window_length,
-                                         nfft=64,
-                                         spectrogram_count=spectrogram_count)
-
-# Create 10 models, and run inference for each SNR once on each model.
-for i in range(training_count):
-    run_name: str
+    if first_iteration >= training_count:
+        print(f"'{run_name}' already has the results of {first_iteration} iterations")
+        return
 
-    if run_name_arg is None:
-        run_name = datetime.now().strftime("%Y%m%d-%H%M%S")
-    else:
-        run_name = run_name_arg
+    if first_iteration > 0:
+        print(f"Continuing from iteration {first_iteration}")
 
-    print(f"Starting iteration {i}")
-    print("Splitting training and test data")
+    if concurrent_training:
+        train_replicas_concurrently(run_name, filters, first_iteration, training_count, lite_evaluation_workers,
+                                    features, writer)
 
-    train_test_sets = sp_training.create_spectrum_painting_train_test_sets(
-        spectrograms=spectrograms,
-        label_names=classes,
-        options=spectrum_painting_options,
-        test_size=0.3
-    )
+        # Save again to add the time of train_replicas_concurrently itself.
+        if profiling.is_enabled():
+            profiling.save(results_prefix)
 
-    print(f"Number of training images: {len(train_test_sets.y_train)}")
-    print(f"Number of testing images: {len(train_test_sets.y_test)}")
+        return
 
-    image_shape = train_test_sets.x_train_augmented[0].shape
+    # Create 10 models, and run inference for each SNR once on each model.
+    for i in range(first_iteration, training_count):
+        print(f"Starting iteration {i}")
+        print("Splitting training and test data")
 
-    full_model = sp_model.create_tensorflow_model(image_shape=image_shape,
-                                                  label_count=len(train_test_sets.label_names),
-                                                  filters=filters)
+        train_test_sets = sp_training.split_spectrum_painting_features(features, test_size=0.3)
 
-    sp_model.fit_model(full_model, train_test_sets, epochs=100, early_stopping_patience=10)
+        print(f"Number of training images: {len(train_test_sets.y_train)}")
+        print(f"Number of testing images: {len(train_test_sets.y_test)}")
 
-    output_file = f"output/spectrum-painting-model-{run_name}.keras"
-    full_model.save(output_file, save_format="keras")
-    full_model_size = os.stat(output_file).st_size
+        image_shape = train_test_sets.x_train_augmented[0].shape
 
-    print("\n")
+        mixed_precision = fast_training.mixed_precision if fast_training is not None else None
+
+        full_model = sp_model.create_tensorflow_model(image_shape=image_shape,
+                                                      label_count=len(train_test_sets.label_names),
+                                                      filters=filters,
+                                                      mixed_precision=mixed_precision)
+
+        history = sp_model.fit_model(full_model,
+                                     train_test_sets,
+                                     epochs=100,
+                                     early_stopping_patience=10,
+                                     fast_options=fast_training)
+
+        print(f"\nMean epoch time = {np.mean(history.history['epoch_time'])}s")
+
+        if mixed_precision is not None:
+            # Save and convert a float32 copy of the model.
+            full_model = sp_model.create_float32_copy(full_model,
+                                                      image_shape=image_shape,
+                                                      label_count=len(train_test_sets.label_names),
+                                                      filters=filters)
 
-    lite_model = sp_model.convert_to_tensorflow_lite(full_model,
-                                                     train_test_sets.x_test_augmented,
-                                                     train_test_sets.x_test_painted)
-    lite_model_size = len(lite_model)
+        print("\n")
 
-    lite_output_file = f"output/spectrum-painting-model-{run_name}.tflite"
+        save_and_test_model(full_model, train_test_sets, run_name, writer, i, lite_evaluation_workers)
 
-    with open(lite_output_file, "wb") as f:
-        f.write(lite_model)
+        print("Saving results")
+        writer.commit()
 
-    no_quantization_model = sp_model.convert_to_tensorflow_lite_no_quantization(full_model)
-    no_quantization_file = f"output/spectrum-painting-model-{run_name}-no-quant.tflite"
+        if profiling.is_enabled():
+            profiling.save(results_prefix)
 
-    with open(no_quantization_file, "wb") as f:
-        f.write(no_quantization_model)
+
+@profiling.profiled()
+def train_replicas_concurrently(run_name: str,
+                                filters: int,
+                                first_iteration: int,
+                                training_count: int,
+                                lite_evaluation_workers: Optional[int],
+                                features: sp_training.SpectrumPaintingFeatures,
+                                writer: results_store.ResultsStoreWriter):
+    """
+    Train all the models of the repeated runs at the same time as one ensemble. Each replica
+    still has its own split of the data and is saved and tested on its own.
+
+    :param first_iteration: The iteration of the first replica. Iterations from first_iteration
+                            up to training_count are trained.
+    """
+    replica_count = training_count - first_iteration
+
+    print(f"Training {replica_count} models at the same time")
+
+    splits = [sp_training.split_feature_indices(features, test_size=0.3) for _ in range(replica_count)]
+    image_shape = features.x_augmented.shape[1:]
+
+    (ensemble, replicas) = sp_model.create_tensorflow_ensemble(image_shape=image_shape,
+                                                               label_count=len(features.label_names),
+                                                               filters=filters,
+                                                               replicas=replica_count)
+
+    sp_model.fit_ensemble(ensemble,
+                          features,
+                          train_indices=[train_indices for (train_indices, _) in splits],
+                          test_indices=[test_indices for (_, test_indices) in splits],
+                          epochs=100,
+                          early_stopping_patience=10)
+
+    print("\n")
+
+    for (i, (replica, (train_indices, test_indices))) in enumerate(zip(replicas, splits)):
+        print(f"Testing replica {i}")
+
+        train_test_sets = sp_training.create_train_test_sets_from_indices(features, train_indices, test_indices)
+        iteration = first_iteration + i
+        save_and_test_model(replica, train_test_sets, f"{run_name}-replica-{iteration}", writer, iteration,
+                            lite_evaluation_workers)
+
+        print("Saving results")
+        writer.commit()
+
+        if profiling.is_enabled():
+            profiling.save(f"output/results-{run_name}")
+
+
+@profiling.profiled()
+def save_and_test_model(full_model: tf.keras.models.Model,
+                        train_test_sets: sp_training.SpectrumPaintingTrainTestSets,
+                        model_name: str,
+                        writer: results_store.ResultsStoreWriter,
+                        iteration: int,
+                        lite_evaluation_workers: Optional[int]):
+    """
+    Save the trained model, convert it to TensorFlow Lite and append the results
+    of testing both models at every SNR to the results store. The results are
+    written when writer.commit is called.
+    """
+    output_file = f"output/spectrum-painting-model-{model_name}.keras"
+    full_model.save(output_file, save_format="keras")
+    full_model_size = os.stat(output_file).st_size
+
+    # Converting takes a few seconds so the models are cached by their weights.
+    lite_model = lite_model_cache.convert_to_tensorflow_lite_cached(full_model,
+                                                                    train_test_sets.x_test_augmented,
+                                                                    train_test_sets.x_test_painted,
+                                                                    labels=train_test_sets.y_test,
+                                                                    snrs=train_test_sets.test_snr,
+                                                                    calibration_samples=calibration_samples)
+    lite_model_size = lite_model.size
+
+    lite_output_file = f"output/spectrum-painting-model-{model_name}.tflite"
+    shutil.copyfile(lite_model.path, lite_output_file)
+
+    no_quantization_model = lite_model_cache.convert_to_tensorflow_lite_no_quantization_cached(full_model)
+    no_quantization_file = f"output/spectrum-painting-model-{model_name}-no-quant.tflite"
+    shutil.copyfile(no_quantization_model.path, no_quantization_file)
+
+    # The quantized model finds its inputs by name in the same way.
+    sp_predict.check_lite_model_inputs(full_model,
+                                       sp_predict.LiteModelRunner(no_quantization_model.content, num_threads=1),
+                                       train_test_sets.x_test_augmented,
+                                       train_test_sets.x_test_painted)
+
+    print("Testing")
+    all_full_model_predictions = sp_predict.predict_full_model_batch(full_model,
+                                                                     train_test_sets.x_test_augmented,
+                                                                     train_test_sets.x_test_painted)
+
+    # Evaluate the test images of every SNR at once on a pool of threads
+    # that each have their own single-threaded interpreter.
+    lite_model_runner = sp_predict.LiteModelRunner(lite_model.content, num_threads=1)
+    all_lite_model_predictions = sp_predict.predict_lite_model_parallel(lite_model_runner,
+                                                                        train_test_sets.x_test_augmented,
+                                                                        train_test_sets.x_test_painted,
+                                                                        workers=lite_evaluation_workers)
 
     for snr in snr_list:
         print(f"Testing SNR: {snr}")
 
         test_indices = np.argwhere(train_test_sets.test_snr == snr).squeeze()
         test_labels = train_test_sets.y_test[test_indices]
-        test_augmented = train_test_sets.x_test_augmented[test_indices]
-        test_painted = train_test_sets.x_test_painted[test_indices]
 
-        full_model_predictions = [sp_predict.predict_full_model(full_model, x_a, x_p) for (x_a, x_p) in
-                                  zip(test_augmented, test_painted)]
-        lite_model_predictions = [sp_predict.predict_lite_model(lite_model, x_a, x_p) for (x_a, x_p) in
-                                  zip(test_augmented, test_painted)]
+        full_model_predictions = all_full_model_predictions[test_indices].tolist()
+        lite_model_predictions = all_lite_model_predictions[test_indices].tolist()
 
         full_model_result = ModelResult(
             labels=test_labels.astype(int).tolist(),
@@ -159,18 +296,57 @@ for i in range(training_count):
             size=lite_model_size
         )
 
-        results[snr].label_names = train_test_sets.label_names
-        results[snr].full_model_results.append(full_model_result)
-        results[snr].lite_model_results.append(lite_model_result)
+        writer.append(iteration, snr, "full", full_model_result)
+        writer.append(iteration, snr, "lite", lite_model_result)
 
         print(f"Full model accuracy = {calc_accuracy(test_labels, full_model_predictions)}")
         print(f"Lite model accuracy = {calc_accuracy(test_labels, lite_model_predictions)}")
 
-    print("Saving results")
-    with open(f"output/results-{run_name}.json", "w") as f:
-        result_list = []
 
-        for (snr, result) in results.items():
-            result_list.append(result.to_dict())
+@profiling.profiled()
+def create_features(spectrogram_count: int,
+                    num_windows: int,
+                    spectrum_painting_options: sp_training.SpectrumPaintingTrainingOptions) -> sp_training.SpectrumPaintingFeatures:
+    number_samples = 65536
+    window_length: int = number_samples // num_windows
+
+    print("Loading spectrograms")
+    # Create the spectrograms once. They are cached on disk so later runs with
+    # the same number of windows do not compute them again.
+    spectrograms = spectrogram_cache.load_spectrograms_cached(data_dir="data/numpy",
+                                                              classes=classes,
+                                                              snr_list=snr_list,
+                                                              windows_per_spectrogram=num_windows,
+                                                              window_length=window_length,
+                                                              nfft=64,
+                                                              spectrogram_count=spectrogram_count)
+
+    print("Creating augmented and painted images")
+    # Do spectrum painting once. Each iteration only splits the images differently.
+    return sp_training.create_spectrum_painting_features(spectrograms=spectrograms,
+                                                         label_names=classes,
+                                                         options=spectrum_painting_options)
+
+
+if __name__ == "__main__":
+    run_name_arg: Optional[str] = None
+    filters: int = 2
+    spectrogram_count: int = -1
+    num_windows: int = 256
+
+    if len(sys.argv) > 1:
+        run_name_arg = sys.argv[1]
+
+    if len(sys.argv) > 2:
+        filters = int(sys.argv[2])
+
+    if len(sys.argv) > 3:
+        spectrogram_count = int(sys.argv[3])
+
+    if len(sys.argv) > 4:
+        num_windows = int(sys.argv[4])
+
+    concurrent_training: bool = len(sys.argv) > 5 and sys.argv[5] == "concurrent"
 
-        json.dump({"results": result_list}, f)
+    run_repeated_runs(run_name_arg, filters, spectrogram_count, num_windows,
+                      concurrent_training=concurrent_training)
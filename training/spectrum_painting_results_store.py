@@ -0,0 +1,318 @@
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from spectrum_painting_result import SpectrumPaintingResult, ModelResult
+
+# A compact binary alternative to the results-{run_name}.json files.
+#
+# A store is a directory with one raw binary file per column and a meta.json file.
+# Each row is one prediction of one test image. Rows of the same run, SNR and model
+# type are next to each other and each group of rows is described by a record in
+# meta.json with its start row, row count and model size.
+#
+# New rows are appended to the end of the column files and are only part of the
+# store when meta.json is replaced with the new number of rows. If writing is
+# interrupted the extra rows are ignored and removed by the next writer.
+#
+# Only the label and prediction of each row are stored in column files, one byte each.
+# They are read with np.memmap so only the columns that are used are read from disk.
+# The run, SNR and model type of each row are the same for every row of a record so
+# those columns are created from the records when they are used.
+#
+# meta.json can also have the parameters of the run, e.g the number of filters, so the
+# results of a run are never continued with different parameters.
+
+STORE_VERSION = 1
+
+columns: Dict[str, np.dtype] = {
+    "label": np.dtype(np.uint8),
+    "prediction": np.dtype(np.uint8),
+}
+
+record_columns: Dict[str, np.dtype] = {
+    "run": np.dtype(np.int64),
+    "snr": np.dtype(np.int64),
+    "model": np.dtype(np.uint8),
+}
+
+# The values of the model column.
+model_types = ["full", "lite"]
+
+
+def get_store_dir(results_file: str) -> str:
+    """
+    The store for a results file is next to it without the extension, e.g
+    output/results-windows-64.json is stored in output/results-windows-64.
+    """
+    (root, extension) = os.path.splitext(results_file)
+
+    if extension != ".json":
+        return results_file
+
+    return root
+
+
+def read_meta(directory: str) -> Optional[dict]:
+    meta_file = os.path.join(directory, "meta.json")
+
+    if not os.path.exists(meta_file):
+        return None
+
+    with open(meta_file, "r") as f:
+        return json.load(f)
+
+
+class ResultsStore:
+    """
+    Reads a results store. The columns are memory-mapped the first time they are used.
+    """
+
+    def __init__(self, directory: str):
+        meta = read_meta(directory)
+
+        if meta is None:
+            raise FileNotFoundError(f"There is no results store in {directory}")
+
+        self.directory = directory
+        self.label_names: List[str] = meta["label_names"]
+        # None for stores written without parameters.
+        self.parameters: Optional[dict] = meta.get("parameters")
+        self.rows: int = meta["rows"]
+        self.records: List[dict] = meta["records"]
+        self._columns: Dict[str, npt.NDArray] = {}
+
+    def column(self, name: str) -> npt.NDArray:
+        """
+        A read-only array with the committed values of a column.
+
+        :param name: label, prediction, run, snr or model. The model column is the index in model_types.
+        """
+        if name in record_columns and name not in self._columns:
+            if name == "model":
+                values = [model_types.index(record["model"]) for record in self.records]
+            else:
+                values = [record[name] for record in self.records]
+
+            counts = [record["count"] for record in self.records]
+            self._columns[name] = np.repeat(np.asarray(values, dtype=record_columns[name]), counts)
+
+        if name not in self._columns:
+            dtype = columns[name]
+
+            # np.memmap can not map an empty file.
+            if self.rows == 0:
+                self._columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(os.path.join(self.directory, f"{name}.bin"),
+                                                dtype=dtype,
+                                                mode="r",
+                                                shape=(self.rows,))
+
+        return self._columns[name]
+
+    @property
+    def runs(self) -> List[int]:
+        """
+        The runs in the store in the order they were written.
+        """
+        return list(dict.fromkeys(record["run"] for record in self.records))
+
+    def to_results(self) -> Dict[int, SpectrumPaintingResult]:
+        """
+        Convert the store to the results of every SNR in the same form as the JSON files.
+        """
+        labels = self.column("label")
+        predictions = self.column("prediction")
+
+        results: Dict[int, SpectrumPaintingResult] = {}
+
+        for record in self.records:
+            snr = record["snr"]
+
+            if snr not in results:
+                results[snr] = SpectrumPaintingResult(snr=snr,
+                                                      label_names=self.label_names,
+                                                      full_model_results=[],
+                                                      lite_model_results=[])
+
+            start = record["start"]
+            end = start + record["count"]
+
+            model_result = ModelResult(labels=labels[start:end].tolist(),
+                                       predictions=predictions[start:end].tolist(),
+                                       size=record["size"])
+
+            if record["model"] == "full":
+                results[snr].full_model_results.append(model_result)
+            else:
+                results[snr].lite_model_results.append(model_result)
+
+        return results
+
+
+class ResultsStoreWriter:
+    """
+    Appends results to a results store. Results are added with append and are written
+    to the store when commit is called.
+    """
+
+    def __init__(self, directory: str, label_names: List[str], parameters: Optional[dict] = None):
+        """
+        :param parameters: The parameters of the run, which are written to meta.json. They must be
+                           the same as the parameters of the results already in the store. Defaults
+                           to the parameters in the store.
+        :raises ValueError: If the store has results with different labels or parameters.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.label_names = list(label_names)
+        # Compare the parameters in the same form as they are read from meta.json, e.g tuples become lists.
+        self.parameters: Optional[dict] = json.loads(json.dumps(parameters)) if parameters is not None else None
+
+        meta = read_meta(directory)
+
+        if meta is None:
+            self.rows = 0
+            self.records: List[dict] = []
+        else:
+            if meta["label_names"] != self.label_names:
+                raise ValueError(f"The results in {directory} have the labels {meta['label_names']} "
+                                 f"and not {self.label_names}")
+
+            stored_parameters = meta.get("parameters")
+
+            # Stores written without parameters can not be checked, so they are given these parameters.
+            if stored_parameters is not None:
+                if self.parameters is not None and stored_parameters != self.parameters:
+                    raise ValueError(f"The results in {directory} have the parameters {stored_parameters} "
+                                     f"and not {self.parameters}")
+
+                self.parameters = stored_parameters
+
+            self.rows = meta["rows"]
+            self.records = meta["records"]
+
+        # Remove rows that were written but not committed.
+        for (name, dtype) in columns.items():
+            with open(os.path.join(directory, f"{name}.bin"), "ab") as f:
+                f.truncate(self.rows * dtype.itemsize)
+
+        self._pending_records: List[dict] = []
+        self._pending_columns: Dict[str, List[npt.NDArray]] = {name: [] for name in columns}
+
+    @property
+    def next_run(self) -> int:
+        """
+        The number of the run after the last committed run.
+        """
+        return max((record["run"] for record in self.records), default=-1) + 1
+
+    def append(self, run: int, snr: int, model_type: str, result: ModelResult):
+        """
+        :param run: The iteration of the repeated runs.
+        :param model_type: "full" or "lite".
+        """
+        if model_type not in model_types:
+            raise ValueError(f"The model type must be one of {model_types}")
+
+        count = len(result.labels)
+        start = self.rows + sum(r["count"] for r in self._pending_records)
+
+        self._pending_records.append({
+            "run": run,
+            "snr": snr,
+            "model": model_type,
+            "size": result.size,
+            "start": start,
+            "count": count
+        })
+
+        self._pending_columns["label"].append(np.asarray(result.labels, dtype=columns["label"]))
+        self._pending_columns["prediction"].append(np.asarray(result.predictions, dtype=columns["prediction"]))
+
+    def commit(self):
+        """
+        Write the appended results. Either all of them are in the store afterwards or none of them.
+        """
+        if len(self._pending_records) == 0:
+            return
+
+        for (name, dtype) in columns.items():
+            with open(os.path.join(self.directory, f"{name}.bin"), "ab") as f:
+                np.concatenate(self._pending_columns[name]).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.rows += sum(r["count"] for r in self._pending_records)
+        self.records = self.records + self._pending_records
+
+        meta = {
+            "version": STORE_VERSION,
+            "label_names": self.label_names,
+            "parameters": self.parameters,
+            "rows": self.rows,
+            "records": self.records
+        }
+
+        # Replace meta.json in one step so it always describes complete rows.
+        temp_file = os.path.join(self.directory, "meta.json.tmp")
+
+        with open(temp_file, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_file, os.path.join(self.directory, "meta.json"))
+
+        self._pending_records = []
+        self._pending_columns = {name: [] for name in columns}
+
+
+def append_results(writer: ResultsStoreWriter, results: Dict[int, SpectrumPaintingResult], first_run: int = 0):
+    """
+    Append results in the same form as the JSON files. The i-th result of every SNR is run first_run + i.
+    """
+    for (snr, result) in results.items():
+        for (i, model_result) in enumerate(result.full_model_results):
+            writer.append(first_run + i, snr, "full", model_result)
+
+        for (i, model_result) in enumerate(result.lite_model_results):
+            writer.append(first_run + i, snr, "lite", model_result)
+
+
+def convert_json_results(results_file: str, directory: Optional[str] = None) -> str:
+    """
+    Convert a results-{run_name}.json file to a results store.
+
+    :param directory: Defaults to the results file without the extension.
+    :return: The directory of the store.
+    """
+    if directory is None:
+        directory = get_store_dir(results_file)
+
+    if read_meta(directory) is not None:
+        raise FileExistsError(f"There is already a results store in {directory}")
+
+    with open(results_file, "r") as f:
+        result_list = [SpectrumPaintingResult.from_dict(r) for r in json.load(f)["results"]]
+
+    if len(result_list) == 0:
+        return directory
+
+    writer = ResultsStoreWriter(directory, result_list[0].label_names)
+    append_results(writer, {result.snr: result for result in result_list})
+    writer.commit()
+
+    return directory
+
+
+if __name__ == "__main__":
+    # Convert results files, e.g python spectrum_painting_results_store.py output/results-*.json
+    for results_file in sys.argv[1:]:
+        print(f"Converted {results_file} to {convert_json_results(results_file)}")
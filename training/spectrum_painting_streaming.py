@@ -0,0 +1,240 @@
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+import spectrum_painting_predict as sp_predict
+import spectrum_painting_training as sp_training
+from spectrogram import create_spectrogram_values
+
+# Classify a continuous stream of I/Q samples in real time.
+#
+# The samples are decimated by 4 like load_decimated_iq_data and split into windows of
+# window_length samples. Each window becomes one row of the spectrogram as soon as all of its
+# samples have arrived, so every row is only computed once. Every hop rows the last
+# windows_per_spectrogram rows are painted and classified by the TensorFlow Lite model.
+
+
+@dataclass
+class StreamingPrediction:
+    """
+    label: The index of the predicted label.
+    label_name: The name of the predicted label if the classifier has label names.
+    timestamp: The time in the stream at the end of the spectrogram in seconds.
+    latency: The wall time in seconds from receiving the last samples of the spectrogram to the prediction.
+    """
+    label: int
+    label_name: Optional[str]
+    timestamp: float
+    latency: float
+
+
+@dataclass
+class StreamingStats:
+    """
+    Counters to check if the classifier keeps up with the sample rate.
+
+    samples: The number of samples received before decimation.
+    processing_time: The wall time in seconds spent processing the samples.
+    """
+    sample_rate: float
+    samples: int = 0
+    predictions: int = 0
+    processing_time: float = 0.0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def stream_time(self) -> float:
+        """
+        The duration of the received samples in seconds.
+        """
+        return self.samples / self.sample_rate
+
+    @property
+    def throughput(self) -> float:
+        """
+        The number of samples processed per second of wall time.
+        """
+        return self.samples / self.processing_time if self.processing_time > 0 else 0.0
+
+    @property
+    def real_time_factor(self) -> float:
+        """
+        How many times faster than real time the samples are processed. Below 1 the classifier falls behind.
+        """
+        return self.throughput / self.sample_rate
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.predictions if self.predictions > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.samples} samples ({self.stream_time * 1000:.2f} ms) in {self.processing_time * 1000:.2f} ms, "
+                f"{self.throughput / 1e6:.2f} MS/s, {self.real_time_factor:.3f}x real time, "
+                f"{self.predictions} predictions, mean latency = {self.mean_latency * 1000:.2f} ms, "
+                f"max latency = {self.max_latency * 1000:.2f} ms")
+
+
+@dataclass
+class StreamingOptions:
+    """
+    windows_per_spectrogram: The number of rows in each spectrogram.
+    window_length: The number of decimated samples in each row.
+    nfft: The FFT length of each row.
+    hop: The number of new rows between predictions.
+    decimation: Keep every n-th sample.
+    sample_rate: The sample rate of the stream before decimation. The generated data is sampled at 88 MHz.
+    """
+    windows_per_spectrogram: int = 256
+    window_length: int = 256
+    nfft: int = 64
+    hop: int = 64
+    decimation: int = 4
+    sample_rate: float = 88e6
+    spectrum_painting_options: sp_training.SpectrumPaintingTrainingOptions = field(
+        default_factory=lambda: sp_training.SpectrumPaintingTrainingOptions(downsample_resolution=64, k=3, l=16, d=4))
+
+
+class StreamingClassifier:
+    """
+    Classifies a continuous stream of complex I/Q samples. Pass chunks of any size to push,
+    or an iterable of chunks to run.
+    """
+
+    def __init__(self,
+                 runner: sp_predict.LiteModelRunner,
+                 options: Optional[StreamingOptions] = None,
+                 label_names: Optional[List[str]] = None):
+        """
+        :param runner: The TensorFlow Lite model.
+        :param label_names: The names of the labels in the order of the model's outputs.
+        """
+        if options is None:
+            options = StreamingOptions()
+
+        self.runner = runner
+        self.options = options
+        self.label_names = label_names
+        self.stats = StreamingStats(sample_rate=options.sample_rate)
+
+        # The index in the next chunk of the first sample to keep after decimation.
+        self._decimation_phase = 0
+
+        # Decimated samples that are not part of a complete window yet.
+        self._pending_samples = np.empty(0, dtype=np.complex64)
+
+        # The newest rows of the spectrogram, oldest first. There are at most windows_per_spectrogram of them.
+        self._rows = np.empty(shape=(0, options.nfft), dtype=np.float64)
+        self._row_count = 0
+
+    def push(self, samples: npt.NDArray[np.complex64]) -> List[StreamingPrediction]:
+        """
+        Add samples to the stream.
+
+        :return: The predictions of the spectrograms that were completed by these samples.
+        """
+        start = time.perf_counter()
+        options = self.options
+
+        samples = np.asarray(samples)
+        decimated = samples[self._decimation_phase::options.decimation]
+        self._decimation_phase = (self._decimation_phase - len(samples)) % options.decimation
+
+        pending = np.concatenate((self._pending_samples, decimated))
+        new_row_count = len(pending) // options.window_length
+        used_samples = new_row_count * options.window_length
+
+        new_rows = create_spectrogram_values(pending[:used_samples],
+                                             new_row_count,
+                                             options.window_length,
+                                             options.nfft,
+                                             dtype=np.float64)
+
+        self._pending_samples = pending[used_samples:].copy()
+
+        # The rows that can still be part of a spectrogram followed by the new rows.
+        # first_row is the number of the first of these rows in the stream.
+        rows = np.concatenate((self._rows, new_rows))
+        first_row = self._row_count - len(self._rows)
+        previous_row_count = self._row_count
+        self._row_count += new_row_count
+
+        # The spectrograms end after windows_per_spectrogram rows and then every hop rows.
+        windows = options.windows_per_spectrogram
+        first_end = max(windows, previous_row_count + 1)
+        first_end = windows + -(-(first_end - windows) // options.hop) * options.hop
+        spectrogram_ends = np.arange(first_end, self._row_count + 1, options.hop)
+
+        predictions: List[StreamingPrediction] = []
+
+        if len(spectrogram_ends) > 0:
+            spectrograms = np.stack([rows[end - windows - first_row:end - first_row] for end in spectrogram_ends])
+
+            (augmented, painted) = sp_training.create_augmented_painted_images_batch(
+                spectrograms, options.spectrum_painting_options)
+
+            labels = self.runner.predict_batch(augmented, painted)
+
+            end_time = time.perf_counter()
+            latency = end_time - start
+            samples_per_row = options.window_length * options.decimation
+
+            for (end, label) in zip(spectrogram_ends, labels):
+                predictions.append(StreamingPrediction(
+                    label=int(label),
+                    label_name=self.label_names[label] if self.label_names is not None else None,
+                    timestamp=end * samples_per_row / options.sample_rate,
+                    latency=latency
+                ))
+
+            self.stats.predictions += len(predictions)
+            self.stats.total_latency += latency * len(predictions)
+            self.stats.max_latency = max(self.stats.max_latency, latency)
+
+        self._rows = rows[-windows:].copy()
+
+        self.stats.samples += len(samples)
+        self.stats.processing_time += time.perf_counter() - start
+
+        return predictions
+
+    def run(self, stream: Iterable[npt.NDArray[np.complex64]]) -> Iterator[StreamingPrediction]:
+        """
+        Classify an unbounded stream of chunks of samples.
+        """
+        for samples in stream:
+            yield from self.push(samples)
+
+
+def read_chunks(file: str, chunk_size: int = 65536) -> Iterator[npt.NDArray[np.complex64]]:
+    """
+    Stream the samples in a .npy file in chunks like they would arrive from a radio.
+    """
+    samples = np.load(file, mmap_mode="r")
+
+    for start in range(0, len(samples), chunk_size):
+        yield np.asarray(samples[start:start + chunk_size], dtype=np.complex64)
+
+
+if __name__ == "__main__":
+    # python spectrum_painting_streaming.py <model.tflite> <samples.npy> [hop]
+    with open(sys.argv[1], "rb") as f:
+        lite_model = f.read()
+
+    streaming_options = StreamingOptions()
+
+    if len(sys.argv) > 3:
+        streaming_options.hop = int(sys.argv[3])
+
+    classifier = StreamingClassifier(sp_predict.LiteModelRunner(lite_model),
+                                     streaming_options,
+                                     label_names=["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"])
+
+    for prediction in classifier.run(read_chunks(sys.argv[2])):
+        print(f"{prediction.timestamp * 1000:.3f} ms: {prediction.label_name}")
+
+    print(classifier.stats)
@@ -0,0 +1,294 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+import spectrogram_cache
+import spectrum_painting_data as sp_data
+import spectrum_painting_results_store as results_store
+import spectrum_painting_training as sp_training
+
+# Run spectrum_painting_repeated_runs for every combination of a grid of parameters.
+# Trials run at the same time in a pool of processes that are each pinned to their
+# own CPUs. The spectrograms and painted images for each pre-processing setting are
+# created once and shared by every trial that uses them. Trials that already have
+# a complete results file are skipped so the sweep can be resumed.
+
+classes = ["Z", "B", "W", "BW", "ZB", "ZW", "ZBW"]
+snr_list = [0, 5, 10, 15, 20, 25, 30]
+
+number_samples = 65536
+
+
+@dataclass(frozen=True)
+class SweepTrial:
+    filters: int
+    num_windows: int
+    spectrogram_count: int
+    k: int
+    l: int
+    d: int
+    downsample_resolution: int
+
+    def get_options(self) -> sp_training.SpectrumPaintingTrainingOptions:
+        return sp_training.SpectrumPaintingTrainingOptions(
+            downsample_resolution=self.downsample_resolution,
+            k=self.k,
+            l=self.l,
+            d=self.d
+        )
+
+    def get_features_key(self) -> Tuple[int, int, int, int, int, int]:
+        """
+        Trials with the same key use the same augmented and painted images.
+        """
+        return self.num_windows, self.spectrogram_count, self.k, self.l, self.d, self.downsample_resolution
+
+
+# The names of the parameters in the run names.
+parameter_names: Dict[str, str] = {
+    "filters": "filters",
+    "num_windows": "windows",
+    "spectrogram_count": "count",
+    "k": "k",
+    "l": "l",
+    "d": "d",
+    "downsample_resolution": "resolution",
+}
+
+
+def create_trials(grid: Dict[str, List[int]]) -> List[SweepTrial]:
+    """
+    Create a trial for every combination of the values in the grid.
+
+    :param grid: Maps the name of each SweepTrial field to the values to try.
+    """
+    names = list(grid.keys())
+    return [SweepTrial(**dict(zip(names, values))) for values in itertools.product(*grid.values())]
+
+
+def get_run_name(trial: SweepTrial, grid: Dict[str, List[int]], prefix: Optional[str] = None) -> str:
+    """
+    The run name only contains the parameters that have more than one value
+    in the grid, e.g windows-64.
+    """
+    parts = [prefix] if prefix else []
+
+    for (name, values) in grid.items():
+        if len(values) > 1:
+            parts.append(f"{parameter_names[name]}-{getattr(trial, name)}")
+
+    if len(parts) == 0:
+        parts.append("sweep")
+
+    return "-".join(parts)
+
+
+def is_trial_complete(run_name: str, training_count: int) -> bool:
+    """
+    Whether the results of a trial have every iteration.
+    """
+    store_dir = f"output/results-{run_name}"
+
+    if results_store.read_meta(store_dir) is not None:
+        return len(results_store.ResultsStore(store_dir).runs) >= training_count
+
+    # Results from before the results store was used.
+    results_file = f"output/results-{run_name}.json"
+
+    if not os.path.exists(results_file):
+        return False
+
+    try:
+        with open(results_file, "r") as f:
+            results = json.load(f)["results"]
+    except (ValueError, KeyError):
+        return False
+
+    return all(len(r["full_model_results"]) >= training_count for r in results)
+
+
+def get_features_dir(trial: SweepTrial) -> str:
+    """
+    The features are stored in a directory named after the pre-processing settings and the key of the
+    spectrogram cache, which changes when a data file is regenerated.
+    """
+    (num_windows, spectrogram_count, k, l, d, resolution) = trial.get_features_key()
+    window_length = number_samples // num_windows
+
+    files = sp_data.get_spectrogram_files("data/numpy", classes, snr_list, num_windows * window_length,
+                                          spectrogram_count)
+    source_key = spectrogram_cache.get_cache_key(files, num_windows, window_length, 64)
+
+    return (f"data/cache/features/windows-{num_windows}-count-{spectrogram_count}"
+            f"-k-{k}-l-{l}-d-{d}-resolution-{resolution}-{source_key[:16]}")
+
+
+def create_features(trial: SweepTrial) -> str:
+    """
+    Create and save the augmented and painted images for a trial if they do not exist.
+
+    :return: The directory of the features.
+    """
+    features_dir = get_features_dir(trial)
+
+    if os.path.exists(features_dir):
+        return features_dir
+
+    window_length = number_samples // trial.num_windows
+
+    spectrograms = spectrogram_cache.load_spectrograms_cached(data_dir="data/numpy",
+                                                              classes=classes,
+                                                              snr_list=snr_list,
+                                                              windows_per_spectrogram=trial.num_windows,
+                                                              window_length=window_length,
+                                                              nfft=64,
+                                                              spectrogram_count=trial.spectrogram_count)
+
+    features = sp_training.create_spectrum_painting_features(spectrograms=spectrograms,
+                                                             label_names=classes,
+                                                             options=trial.get_options())
+
+    # Write to a temporary directory first so a crash never leaves
+    # partially written features.
+    parent_dir = os.path.dirname(features_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(features_dir)}-", dir=parent_dir)
+
+    sp_training.save_spectrum_painting_features(features, temp_dir)
+
+    try:
+        os.rename(temp_dir, features_dir)
+    except OSError:
+        # Another process created the same features first.
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return features_dir
+
+
+def pin_worker(cpu_queue: multiprocessing.Queue):
+    """
+    Pin the worker process to its own set of CPUs and limit the number of TensorFlow threads to match.
+    This runs before TensorFlow is imported in the worker.
+    """
+    cpus: List[int] = cpu_queue.get()
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(len(cpus))
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_trial(trial: SweepTrial,
+              run_name: str,
+              features_dir: str,
+              training_count: int,
+              lite_evaluation_workers: int) -> str:
+    # Import here so TensorFlow is only imported in the workers after they are pinned.
+    import spectrum_painting_repeated_runs
+
+    features = sp_training.load_spectrum_painting_features(features_dir)
+
+    spectrum_painting_repeated_runs.run_repeated_runs(run_name,
+                                                      filters=trial.filters,
+                                                      spectrogram_count=trial.spectrogram_count,
+                                                      num_windows=trial.num_windows,
+                                                      spectrum_painting_options=trial.get_options(),
+                                                      training_count=training_count,
+                                                      lite_evaluation_workers=lite_evaluation_workers,
+                                                      features=features)
+
+    return run_name
+
+
+def run_sweep(grid: Dict[str, List[int]],
+              workers: int,
+              training_count: int = 10,
+              prefix: Optional[str] = None):
+    """
+    :param grid: Maps the name of each SweepTrial field to the values to try.
+    :param workers: The number of trials to run at the same time.
+    """
+    trials = create_trials(grid)
+    pending: List[Tuple[SweepTrial, str]] = []
+
+    for trial in trials:
+        run_name = get_run_name(trial, grid, prefix)
+
+        if is_trial_complete(run_name, training_count):
+            print(f"Skipping '{run_name}' because it is already complete")
+        else:
+            pending.append((trial, run_name))
+
+    if len(pending) == 0:
+        return
+
+    # Create the shared pre-processed data before starting the trials.
+    features_dirs: Dict[Tuple[int, ...], str] = {}
+
+    for (trial, run_name) in pending:
+        if trial.get_features_key() not in features_dirs:
+            print(f"Creating features for {asdict(trial)}")
+            features_dirs[trial.get_features_key()] = create_features(trial)
+
+    # Split the CPUs evenly between the workers.
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    workers = max(1, min(workers, len(pending), len(cpus)))
+    cpus_per_worker = len(cpus) // workers
+
+    # Spawn the workers so they do not inherit any state from this process.
+    context = multiprocessing.get_context("spawn")
+    cpu_queue = context.Queue()
+
+    for w in range(workers):
+        cpu_queue.put(cpus[w * cpus_per_worker:(w + 1) * cpus_per_worker])
+
+    os.makedirs("output", exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=context,
+                             initializer=pin_worker,
+                             initargs=(cpu_queue,)) as executor:
+        futures = [executor.submit(run_trial, trial, run_name, features_dirs[trial.get_features_key()],
+                                   training_count, cpus_per_worker)
+                   for (trial, run_name) in pending]
+
+        for future in as_completed(futures):
+            print(f"Finished '{future.result()}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run spectrum painting trials for a grid of parameters.")
+    parser.add_argument("--filters", type=int, nargs="+", default=[2])
+    parser.add_argument("--num-windows", type=int, nargs="+", default=[256])
+    parser.add_argument("--spectrogram-count", type=int, nargs="+", default=[-1])
+    parser.add_argument("--k", type=int, nargs="+", default=[3])
+    parser.add_argument("--l", type=int, nargs="+", default=[16])
+    parser.add_argument("--d", type=int, nargs="+", default=[4])
+    parser.add_argument("--downsample-resolution", type=int, nargs="+", default=[64])
+    parser.add_argument("--workers", type=int, default=1, help="The number of trials to run at the same time.")
+    parser.add_argument("--training-count", type=int, default=10)
+    parser.add_argument("--prefix", type=str, default=None, help="The start of every run name.")
+    args = parser.parse_args()
+
+    run_sweep(grid={
+        "filters": args.filters,
+        "num_windows": args.num_windows,
+        "spectrogram_count": args.spectrogram_count,
+        "k": args.k,
+        "l": args.l,
+        "d": args.d,
+        "downsample_resolution": args.downsample_resolution,
+    },
+        workers=args.workers,
+        training_count=args.training_count,
+        prefix=args.prefix)
@@ -1,10 +1,13 @@
+import json
+import os
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence
 
 import numpy as np
 import numpy.typing as npt
 from sklearn.model_selection import train_test_split
 
+import profiling
 import spectrum_painting as sp
 from spectrogram import Spectrogram
 
@@ -32,6 +35,25 @@ class SpectrumPaintingTrainTestSets:
     label_names: List[str]
 
 
+@dataclass
+class SpectrumPaintingFeatures:
+    """
+    The digitized augmented and painted images of every spectrogram before they are
+    split into training and test sets.
+
+    x_augmented: A (N, resolution, augmented width) array of the augmented images.
+    x_painted: A (N, resolution, augmented width) array of the painted images.
+    labels: The index of the label of each image.
+    snr: The signal-to-noise ratio of each image.
+    """
+    x_augmented: npt.NDArray[np.uint8]
+    x_painted: npt.NDArray[np.uint8]
+    labels: npt.NDArray[np.uint8]
+    snr: npt.NDArray[np.int64]
+
+    label_names: List[str]
+
+
 def create_augmented_painted_images_digitize_before_painting(spectrogram: npt.NDArray,
                                     options: SpectrumPaintingTrainingOptions) -> (
         npt.NDArray[np.uint8], npt.NDArray[np.uint8]):
@@ -61,19 +83,54 @@ def create_augmented_painted_images(spectrogram: npt.NDArray,
     return digitized_augmented, digitized_painted
 
 
-def create_spectrum_painting_train_test_sets(spectrograms: Dict[int, List[Spectrogram]],
-                                             label_names: List[str],
-                                             options: SpectrumPaintingTrainingOptions,
-                                             test_size: float = 0.3) -> SpectrumPaintingTrainTestSets:
+@profiling.profiled()
+def create_augmented_painted_images_batch(spectrograms: Sequence[npt.NDArray],
+                                          options: SpectrumPaintingTrainingOptions,
+                                          chunk_size: int = 512) -> (
+        npt.NDArray[np.uint8], npt.NDArray[np.uint8]):
     """
-    Create the training, test and label sets from a list of spectrograms.
+    The same as create_augmented_painted_images but every step is done on a whole batch of spectrograms.
+
+    :param spectrograms: A (N, time, freq) array or a list of N spectrograms with the same shape.
+    :param chunk_size: The number of spectrograms to process at once. This limits the
+                       size of the intermediate arrays.
+    :return: The digitized augmented and painted images as two (N, resolution, augmented width) arrays.
+    """
+    count = len(spectrograms)
+    resolution = options.downsample_resolution
+    augmented_width = ((resolution - options.l) // options.d) + 1
+
+    digitized_augmented = np.empty(shape=(count, resolution, augmented_width), dtype=np.uint8)
+    digitized_painted = np.empty(shape=(count, resolution, augmented_width), dtype=np.uint8)
+
+    for start in range(0, count, chunk_size):
+        end = min(start + chunk_size, count)
+        chunk = np.stack(spectrograms[start:end])
+
+        downsampled = sp.downsample_spectrogram(chunk, resolution)
+
+        augmented = sp.augment_spectrogram(downsampled, options.k, options.l, options.d)
+        painted = sp.paint_spectrogram(downsampled, augmented)
+
+        digitized_augmented[start:end] = sp.digitize_spectrogram(augmented)
+        digitized_painted[start:end] = sp.digitize_spectrogram(painted)
+
+    return digitized_augmented, digitized_painted
+
+
+@profiling.profiled()
+def create_spectrum_painting_features(spectrograms: Dict[int, List[Spectrogram]],
+                                      label_names: List[str],
+                                      options: SpectrumPaintingTrainingOptions) -> SpectrumPaintingFeatures:
+    """
+    Create the augmented and painted images of every spectrogram once so they can be
+    split into different training and test sets without doing spectrum painting again.
+
     :param spectrograms: A dictionary that maps the class (Z, B, ZBW etc) to spectrograms with different
                         signal-to-noise ratios.
     :param options: The spectrum painting parameters.
-    :param test_size: The proportion of the data to be in the test set.
     """
-    digitized_augmented_slices: List[npt.NDArray[np.uint8]] = []
-    digitized_painted_slices: List[npt.NDArray[np.uint8]] = []
+    spectrogram_values: List[npt.NDArray] = []
     labels: List[int] = []
     snr_list: List[int] = []
 
@@ -87,45 +144,109 @@ def create_spectrum_painting_train_test_sets(spectrograms: Dict[int, List[Spectr
 
         for label_index, (label, slices) in enumerate(sliced_spectrograms.items()):
             for s in slices:
-                (augmented, painted) = create_augmented_painted_images(s, options)
-
-                digitized_augmented_slices.append(augmented)
-                digitized_painted_slices.append(painted)
+                spectrogram_values.append(s)
                 labels.append(label_index)
                 snr_list.append(snr)
 
-    x_combined = np.stack((digitized_augmented_slices, digitized_painted_slices), axis=3)
+    (digitized_augmented, digitized_painted) = create_augmented_painted_images_batch(spectrogram_values, options)
+
+    return SpectrumPaintingFeatures(
+        x_augmented=digitized_augmented,
+        x_painted=digitized_painted,
+        # for tensorflow it must be uint8 and not a Python int.
+        labels=np.asarray(labels, dtype=np.uint8),
+        snr=np.asarray(snr_list, dtype=np.int64),
+        label_names=label_names
+    )
+
 
-    labels_snr_combined = np.stack((labels, snr_list), axis=1)
+def save_spectrum_painting_features(features: SpectrumPaintingFeatures, directory: str):
+    """
+    Save the features to a directory with one .npy file for each array so they can be memory-mapped.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    np.save(f"{directory}/x_augmented.npy", features.x_augmented)
+    np.save(f"{directory}/x_painted.npy", features.x_painted)
+    np.save(f"{directory}/labels.npy", features.labels)
+    np.save(f"{directory}/snr.npy", features.snr)
+
+    with open(f"{directory}/label_names.json", "w") as f:
+        json.dump(features.label_names, f)
+
+
+def load_spectrum_painting_features(directory: str, mmap: bool = True) -> SpectrumPaintingFeatures:
+    """
+    Load features saved with save_spectrum_painting_features.
+
+    :param mmap: Whether to memory-map the images instead of reading them into memory.
+    """
+    mmap_mode = "r" if mmap else None
+
+    with open(f"{directory}/label_names.json", "r") as f:
+        label_names = json.load(f)
+
+    return SpectrumPaintingFeatures(
+        x_augmented=np.load(f"{directory}/x_augmented.npy", mmap_mode=mmap_mode),
+        x_painted=np.load(f"{directory}/x_painted.npy", mmap_mode=mmap_mode),
+        labels=np.load(f"{directory}/labels.npy"),
+        snr=np.load(f"{directory}/snr.npy"),
+        label_names=label_names
+    )
 
-    x_train, x_test, labels_snr_train, labels_snr_test = train_test_split(x_combined,
-                                                                          labels_snr_combined,
-                                                                          test_size=test_size)
 
-    y_train = labels_snr_train[:, 0]
-    snr_train = labels_snr_train[:, 1]
+def split_feature_indices(features: SpectrumPaintingFeatures,
+                          test_size: float = 0.3,
+                          random_state: Optional[int] = None) -> (npt.NDArray[np.int64], npt.NDArray[np.int64]):
+    """
+    Randomly split the indices of the features into training and test indices.
+    """
+    return train_test_split(np.arange(len(features.labels)), test_size=test_size, random_state=random_state)
 
-    y_test = labels_snr_test[:, 0]
-    snr_test = labels_snr_test[:, 1]
 
-    # for tensorflow it must be uint8 and not a Python int.
-    y_train = np.asarray(y_train, dtype=np.uint8)
-    y_test = np.asarray(y_test, dtype=np.uint8)
+@profiling.profiled()
+def split_spectrum_painting_features(features: SpectrumPaintingFeatures,
+                                     test_size: float = 0.3,
+                                     random_state: Optional[int] = None) -> SpectrumPaintingTrainTestSets:
+    """
+    Create the training and test sets by randomly splitting the features.
+
+    :param test_size: The proportion of the data to be in the test set.
+    """
+    (train_indices, test_indices) = split_feature_indices(features, test_size, random_state)
 
-    x_train_augmented = x_train[:, :, :, 0]
-    x_test_augmented = x_test[:, :, :, 0]
+    return create_train_test_sets_from_indices(features, train_indices, test_indices)
 
-    x_train_painted = x_train[:, :, :, 1]
-    x_test_painted = x_test[:, :, :, 1]
 
+@profiling.profiled()
+def create_train_test_sets_from_indices(features: SpectrumPaintingFeatures,
+                                        train_indices: npt.NDArray[np.int64],
+                                        test_indices: npt.NDArray[np.int64]) -> SpectrumPaintingTrainTestSets:
     return SpectrumPaintingTrainTestSets(
-        x_train_augmented,
-        x_train_painted,
-        y_train,
-        snr_train,
-        x_test_augmented,
-        x_test_painted,
-        y_test,
-        snr_test,
-        label_names,
+        features.x_augmented[train_indices],
+        features.x_painted[train_indices],
+        features.labels[train_indices],
+        features.snr[train_indices],
+        features.x_augmented[test_indices],
+        features.x_painted[test_indices],
+        features.labels[test_indices],
+        features.snr[test_indices],
+        features.label_names,
     )
+
+
+@profiling.profiled()
+def create_spectrum_painting_train_test_sets(spectrograms: Dict[int, List[Spectrogram]],
+                                             label_names: List[str],
+                                             options: SpectrumPaintingTrainingOptions,
+                                             test_size: float = 0.3) -> SpectrumPaintingTrainTestSets:
+    """
+    Create the training, test and label sets from a list of spectrograms.
+    :param spectrograms: A dictionary that maps the class (Z, B, ZBW etc) to spectrograms with different
+                        signal-to-noise ratios.
+    :param options: The spectrum painting parameters.
+    :param test_size: The proportion of the data to be in the test set.
+    """
+    features = create_spectrum_painting_features(spectrograms, label_names, options)
+
+    return split_spectrum_painting_features(features, test_size)